@@ -4,12 +4,22 @@ Flask AI Service for Secure Document Processing
 Uses Hugging Face models (Qwen, BART, etc.) for local AI processing
 """
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 from flask_cors import CORS
 import os
 import logging
 import time
 import re
+import itertools
+import json
+import threading
+import hashlib
+import functools
+import queue
+import asyncio
+import copy
+from collections import Counter, OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime
 
 # Configure Hugging Face cache location if specified
@@ -27,91 +37,631 @@ logger = logging.getLogger(__name__)
 app = Flask(__name__)
 CORS(app)  # Enable CORS for Node.js communication
 
+# Compress JSON responses (brotli, then gzip) when flask-compress is installed; SSE streams
+# are left uncompressed so each event is delivered as soon as it is written
+try:
+    from flask_compress import Compress
+    app.config['COMPRESS_ALGORITHM'] = ['br', 'gzip']
+    app.config['COMPRESS_MIN_SIZE'] = 512
+    app.config['COMPRESS_STREAMS'] = False
+    Compress(app)
+except ImportError:
+    pass
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    from blake3 import blake3
+except ImportError:
+    blake3 = None
+
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
+# Text generation model and serving backend ("vllm" or "transformers")
+LLAMA_MODEL_ID = "meta-llama/Llama-3.1-8B-Instruct"
+LLM_BACKEND = os.getenv('LLM_BACKEND', 'vllm').lower()
+VLLM_GPU_MEMORY_UTILIZATION = float(os.getenv('VLLM_GPU_MEMORY_UTILIZATION', '0.9'))
+
+# Weight-only quantization for Llama decode: "none", "awq" (a snapshot produced by
+# quantize_llama.py, pointed to by LLAMA_MODEL_PATH) or "fp8" (quantized at load time)
+LLAMA_QUANTIZATION = os.getenv('LLAMA_QUANTIZATION', 'none').lower()
+LLAMA_MODEL_PATH = os.getenv('LLAMA_MODEL_PATH', LLAMA_MODEL_ID)
+
+# Optional small draft model for speculative decoding (e.g. meta-llama/Llama-3.2-1B-Instruct, which
+# shares Llama-3.1's tokenizer); the 8B model verifies several drafted tokens per forward pass
+LLAMA_DRAFT_MODEL = os.getenv('LLAMA_DRAFT_MODEL', '')
+LLAMA_NUM_SPECULATIVE_TOKENS = int(os.getenv('LLAMA_NUM_SPECULATIVE_TOKENS', '5'))
+
+# torch.compile the transformers models (CUDA only); decode steps then replay captured CUDA graphs
+AI_COMPILE = os.getenv('AI_COMPILE', 'false').lower() == 'true'
+# Generation lengths are rounded up to these buckets so a few captured graphs cover every request
+GENERATION_BUCKETS = (128, 256, 512)
+# With a compiled static cache, prompts are also left-padded to a power-of-two multiple of this
+# width and batches to a power-of-two row count, so the cache shape comes from a small fixed set
+PROMPT_BUCKET_MIN = 256
+
+# Summarizer checkpoint; a distilled variant such as sshleifer/distilbart-cnn-12-6 halves decoder FLOPs
+SUMMARIZATION_MODEL = os.getenv('SUMMARIZATION_MODEL', 'facebook/bart-large-cnn')
+# Optional BART snapshot exported to ONNX with INT8 weights by export_bart_onnx.py; it runs
+# on CPU under ONNX Runtime so summarization doesn't compete with Llama for the GPU.
+# A missing snapshot is exported at startup and reused by later starts
+SUMMARIZATION_ONNX_PATH = os.getenv('SUMMARIZATION_ONNX_PATH', '')
+# Beam search width for BART summaries (0 keeps the checkpoint's default, 4 for bart-large-cnn; 1 is greedy)
+SUMMARIZATION_NUM_BEAMS = int(os.getenv('SUMMARIZATION_NUM_BEAMS', '0'))
+# Texts longer than one BART window are summarized map-reduce style: windows overlap by
+# SUMMARY_CHUNK_OVERLAP tokens and each is condensed to at most SUMMARY_CHUNK_MAX_TOKENS
+SUMMARY_CHUNK_OVERLAP = 64
+SUMMARY_CHUNK_MAX_TOKENS = 128
+
+# Larger documents are refused with 413 before any model work is queued
+MAX_TEXT_CHARS = int(os.getenv('MAX_TEXT_CHARS', '200000'))
+# Bodies too big to hold such a document are refused by Werkzeug before they are read or parsed
+# (JSON spends up to 6 bytes per character on \uXXXX escapes; the rest is room for other fields)
+app.config['MAX_CONTENT_LENGTH'] = MAX_TEXT_CHARS * 6 + 64 * 1024
+# Upper bounds for the max_length / max_summary_length and max_keywords request fields
+MAX_SUMMARY_LENGTH = 1024
+MAX_KEYWORDS = 50
+
+# CPU threads per process for torch and ONNX Runtime (0: this process's cores split across WORKERS,
+# so several gunicorn workers don't each spin up a thread per core)
+TORCH_THREADS = int(os.getenv('TORCH_THREADS', '0'))
+
+# Load and warm the models when the module is imported, for servers that don't call load_models()
+# themselves (hypercorn, flask run); otherwise the first request per process pays for loading
+WARMUP = os.getenv('WARMUP', 'false').lower() == 'true'
+
+LLAMA_SYSTEM_PROMPT = "You are an expert business analyst. Provide concise, professional analysis."
+
+# Llama-3 chat template around every task prompt; tokenized once when the models load
+LLAMA_PROMPT_HEADER = f"<|begin_of_text|><|start_header_id|>system<|end_header_id|>\n{LLAMA_SYSTEM_PROMPT}<|eot_id|><|start_header_id|>user<|end_header_id|>\n"
+LLAMA_PROMPT_FOOTER = "<|eot_id|><|start_header_id|>assistant<|end_header_id|>\n"
+
+# Document-based prompts open with the same excerpt so they share a token prefix whose
+# KV cache is reused (vLLM prefix caching, or one shared prefill on the transformers path)
+DOCUMENT_EXCERPT_CHARS = 1500
+PREFIX_REUSE_MIN_TOKENS = 32
+
+# JSON schema for the single-pass analysis; guided decoding guarantees parseable output.
+# The token budget covers metrics, insights and plots plus room for the requested summary
+# length and keyword count, since JSON cut off by max_tokens can't be parsed
+STRUCTURED_BASE_TOKENS = 512
+STRUCTURED_TOKENS_PER_SUMMARY_WORD = 2
+STRUCTURED_TOKENS_PER_KEYWORD = 8
+DOC_ANALYSIS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "summary": {"type": "string"},
+        "keywords": {"type": "array", "items": {"type": "string"}},  # maxItems set per request
+        "metrics": {"type": "array", "items": {"type": "string"}, "maxItems": 8},
+        "insights": {"type": "string"},
+        "plots": {
+            "type": "array",
+            "maxItems": 2,
+            "items": {
+                "type": "object",
+                "properties": {
+                    "title": {"type": "string"},
+                    "type": {"enum": ["bar", "line", "pie"]},
+                    "labels": {"type": "array", "items": {"type": "string"}},
+                    "values": {"type": "array", "items": {"type": "number"}}
+                },
+                "required": ["title", "type", "labels", "values"]
+            }
+        }
+    },
+    "required": ["summary", "keywords", "metrics", "insights", "plots"]
+}
+
+# Regular expressions used on every request, compiled once
+WHITESPACE_RE = re.compile(r'\s+')
+KEYWORDS_PREFIX_RE = re.compile(r'^(keywords?:?\s*)')
+KEYWORD_PUNCTUATION_RE = re.compile(r'[^\w\s-]')
+FREQUENT_WORD_RE = re.compile(r'\b[a-z]{4,}\b')
+METRIC_PREFIX_RE = re.compile(r'^[\d\.\-\*\•]+\s*')
+METRIC_NUMBER_RE = re.compile(r'[\d,]+(?:\.\d+)?')
+NUMBERING_RE = re.compile(r'^\d+\.\s*')
+BULLET_RE = re.compile(r'^[-•*]\s*')
+NUMBER_RE = re.compile(r'\d+(?:\.\d+)?')
+SENTENCE_RE = re.compile(r'[^.]+')
+
+# Concurrent in-process generate() calls (transformers backend, BART); vLLM schedules its own batch
+GENERATION_CONCURRENCY = int(os.getenv('GENERATION_CONCURRENCY', '8'))
+
+# Finished analyses, summaries and keyword lists are kept by document hash so resubmitted
+# documents skip the models (0 disables the in-process cache)
+RESULT_CACHE_SIZE = int(os.getenv('RESULT_CACHE_SIZE', '256'))
+# Optional Redis behind the in-process cache, shared by every gunicorn worker (entries expire after TTL seconds)
+RESULT_CACHE_REDIS_URL = os.getenv('RESULT_CACHE_REDIS_URL', '')
+RESULT_CACHE_TTL = int(os.getenv('RESULT_CACHE_TTL', '3600'))
+
+# /summarize and /extract-keywords requests arriving within AI_BATCH_WAIT_MS of each other
+# share one batched model call of up to AI_BATCH_MAX texts (1 disables coalescing)
+AI_BATCH_MAX = max(1, int(os.getenv('AI_BATCH_MAX', '16')))
+AI_BATCH_WAIT_MS = float(os.getenv('AI_BATCH_WAIT_MS', '5'))
+# Seconds a request waits for its batched result before giving up with 504
+AI_BATCH_TIMEOUT = float(os.getenv('AI_BATCH_TIMEOUT', '300'))
+
 # Global variables for models (loaded lazily)
+model_load_lock = threading.Lock()
+generation_slots = threading.BoundedSemaphore(GENERATION_CONCURRENCY)
 models_loaded = False
+llm_engine = None
 qwen_pipeline = None
+llama_tokenizer = None
+draft_model = None
 summarization_pipeline = None
 sentiment_pipeline = None
 
+# Whether compile_models switched Llama to a static cache with captured CUDA graphs
+llama_compiled = False
+
+# Set by gunicorn.conf.py's post_fork once PIN_WORKERS has bound this worker to its own cores
+cpu_pinned = False
+
+# LRU cache of prompt segment -> token ids (chat template, document excerpts, task prompts)
+PROMPT_SEGMENT_CACHE_SIZE = 256
+prompt_segment_ids = OrderedDict()
+prompt_segment_lock = threading.Lock()
+
+# LRU cache of results: document_cache_key() -> analysis fields, summary or keyword list
+result_cache = OrderedDict()
+result_cache_lock = threading.Lock()
+
+class ContinuousBatchingEngine:
+    """Drive a vLLM LLMEngine from a background thread.
+
+    Every Flask thread submits its prompts here, so prompts from concurrent
+    requests (and the several prompts of one request) share the same decode
+    steps instead of running one after another.
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._request_ids = itertools.count()
+        self._thread = threading.Thread(target=self._run, name="vllm-engine", daemon=True)
+        self._thread.start()
+
+    def submit(self, prompt, sampling_params):
+        """Queue a prompt and return a Future resolving to the generated text"""
+        future = Future()
+        request_id = str(next(self._request_ids))
+        with self._lock:
+            self._pending[request_id] = future
+            self.engine.add_request(request_id, prompt, sampling_params)
+        self._wakeup.set()
+        return future
+
+    def generate(self, prompts, sampling_params):
+        """Generate completions for a list of prompts, one SamplingParams per prompt"""
+        futures = [self.submit(prompt, params) for prompt, params in zip(prompts, sampling_params)]
+        return [future.result() for future in futures]
+
+    def _run(self):
+        while True:
+            self._wakeup.wait()
+            with self._lock:
+                if not self.engine.has_unfinished_requests():
+                    self._wakeup.clear()
+                    continue
+                try:
+                    outputs = self.engine.step()
+                except Exception as e:
+                    logger.error(f"vLLM engine step failed: {e}")
+                    for request_id, future in self._pending.items():
+                        self.engine.abort_request(request_id)
+                        future.set_exception(e)
+                    self._pending.clear()
+                    continue
+                finished = [(self._pending.pop(out.request_id, None), out) for out in outputs if out.finished]
+            for future, output in finished:
+                if future is not None:
+                    future.set_result(output.outputs[0].text)
+
+class BatchedInferenceEngine:
+    """Coalesce concurrent single-text calls into batched model calls.
+
+    Request threads submit an item and wait on a Future. A worker thread takes
+    the first waiting item, collects more for up to wait_ms (at most max_batch),
+    and runs batch_fn once over the whole list. batch_fn returns one result per
+    item; an exception in a slot fails only that item's Future.
+    """
+
+    def __init__(self, name, batch_fn, max_batch, wait_ms):
+        self.batch_fn = batch_fn
+        self.max_batch = max_batch
+        self.wait = wait_ms / 1000
+        self._start(name)
+        # Workers forked from a preloading gunicorn master inherit the engine but not its thread
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=functools.partial(self._start, name))
+    
+    def _start(self, name):
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, *item):
+        """Queue one item and return a Future resolving to its result"""
+        future = Future()
+        self._queue.put((item, future))
+        return future
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.wait
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            
+            # Drop items whose caller already gave up (cancelled await, client disconnect);
+            # the rest are marked running and can no longer be cancelled under us
+            batch = [(item, future) for item, future in batch if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            
+            try:
+                results = self.batch_fn([item for item, _ in batch])
+            except Exception as e:
+                results = [e] * len(batch)
+            for (_, future), result in zip(batch, results):
+                # A failed delivery must not kill the thread every later request waits on
+                try:
+                    if isinstance(result, Exception):
+                        future.set_exception(result)
+                    else:
+                        future.set_result(result)
+                except Exception as e:
+                    logger.error(f"Batch result delivery error: {e}")
+
+class BatchSamplingControls:
+    """Per-row temperature and token budget for one batched generate() call.
+
+    generate() takes a single temperature and max_new_tokens, so the batch is
+    sampled at temperature 1.0, each row's logits are scaled here, and rows whose
+    budget is spent are forced to emit EOS while the longer rows keep decoding.
+    The same EOS forcing makes rounding max_new_tokens up to a bucket free.
+    """
+
+    def __init__(self, temperatures, max_new_tokens, eos_token_id):
+        self.temperatures = temperatures
+        self.max_new_tokens = max_new_tokens
+        self.eos_token_id = eos_token_id
+        self.prompt_length = None
+
+    def __call__(self, input_ids, scores):
+        if self.prompt_length is None:
+            self.prompt_length = input_ids.shape[1]
+            self.temperatures = scores.new_tensor(self.temperatures).unsqueeze(1)
+        
+        scores = scores / self.temperatures
+        generated = input_ids.shape[1] - self.prompt_length
+        for row, budget in enumerate(self.max_new_tokens):
+            if generated >= budget:
+                scores[row, :] = -float('inf')
+                scores[row, self.eos_token_id] = 0
+        return scores
+
+def select_attention_implementation(torch):
+    """Use FlashAttention-2 when installed on a GPU, otherwise PyTorch's fused SDPA kernels"""
+    if torch.cuda.is_available():
+        try:
+            import flash_attn  # noqa: F401
+            return "flash_attention_2"
+        except ImportError:
+            pass
+    return "sdpa"
+
+def select_cpu_threads():
+    """Intra-op thread count for this process"""
+    if TORCH_THREADS > 0:
+        return TORCH_THREADS
+    cores = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else (os.cpu_count() or 1)
+    # A pinned worker only sees its own slice of cores; anywhere else (including a preloading
+    # master) each worker's share is sized up front
+    if cpu_pinned:
+        return cores
+    return max(1, cores // max(1, int(os.getenv('WORKERS', '1'))))
+
+def size_cpu_threads():
+    """Size torch's CPU thread pools for this process and return the intra-op thread count"""
+    import torch
+    cpu_threads = select_cpu_threads()
+    torch.set_num_threads(cpu_threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        pass  # Only settable before the first parallel op in this process
+    return cpu_threads
+
+def select_torch_dtype(torch):
+    """BF16 on Ampere and newer GPUs (FP32 range, no attention overflow), FP16 on older GPUs, FP32 on CPU.
+
+    Also lets the remaining FP32 matmuls use TF32 tensor cores where available.
+    """
+    if not torch.cuda.is_available():
+        return torch.float32
+    
+    major, _ = torch.cuda.get_device_capability()
+    if major < 8:
+        return torch.float16
+    
+    torch.set_float32_matmul_precision("high")
+    torch.backends.cuda.matmul.allow_tf32 = True
+    torch.backends.cudnn.allow_tf32 = True
+    return torch.bfloat16
+
 def load_models():
     """Load AI models with error handling"""
-    global models_loaded, qwen_pipeline, summarization_pipeline, sentiment_pipeline
+    global models_loaded, llm_engine, qwen_pipeline, llama_tokenizer, draft_model, summarization_pipeline, sentiment_pipeline
     
     if models_loaded:
         return True
     
-    try:
-        logger.info("Loading AI models...")
-        
-        # Import here to avoid startup delays
-        from transformers import pipeline
-        import torch
-        
-        device = 0 if torch.cuda.is_available() else -1
-        device_name = "GPU" if torch.cuda.is_available() else "CPU"
-        logger.info(f"📱 Using device: {device_name}")
+    # Threads of a single gunicorn worker share one copy of the models; only one loads them
+    with model_load_lock:
+        if models_loaded:
+            return True
         
-        # Load Llama model for text generation
         try:
-            logger.info("📥 Loading Llama-3.1-8B-Instruct model...")
-            qwen_pipeline = pipeline(
-                "text-generation",
-                model="meta-llama/Llama-3.1-8B-Instruct",
-                device=device,
-                torch_dtype=torch.float16 if torch.cuda.is_available() else torch.float32,
-                trust_remote_code=True,
-                max_length=2048,
-                padding=True,
-                truncation=True
-            )
-            logger.info("✅ Llama-3.1-8B-Instruct model loaded successfully")
+            logger.info("Loading AI models...")
+            
+            # Import here to avoid startup delays
+            from transformers import pipeline
+            import torch
+            
+            device = 0 if torch.cuda.is_available() else -1
+            device_name = "GPU" if torch.cuda.is_available() else "CPU"
+            logger.info(f"📱 Using device: {device_name}")
+            
+            cpu_threads = size_cpu_threads()
+            logger.info(f"🧵 CPU threads per worker: {cpu_threads}")
+            
+            dtype = select_torch_dtype(torch)
+            # AWQ int4 kernels only take FP16 activations
+            llama_dtype = torch.float16 if LLAMA_QUANTIZATION == 'awq' and torch.cuda.is_available() else dtype
+            logger.info(f"🔢 Using dtype: {str(dtype).replace('torch.', '')}")
+            
+            # Prefer vLLM (PagedAttention + continuous batching) for text generation
+            if LLM_BACKEND == 'vllm' and torch.cuda.is_available():
+                try:
+                    from vllm import EngineArgs, LLMEngine
+                    logger.info("📥 Loading Llama-3.1-8B-Instruct into vLLM engine...")
+                    speculative = {}
+                    if LLAMA_DRAFT_MODEL:
+                        logger.info(f"🎯 Speculative decoding with draft model {LLAMA_DRAFT_MODEL}")
+                        # Older vLLM releases take the draft as flat engine arguments
+                        if hasattr(EngineArgs, 'speculative_model'):
+                            speculative = {'speculative_model': LLAMA_DRAFT_MODEL, 'num_speculative_tokens': LLAMA_NUM_SPECULATIVE_TOKENS}
+                        else:
+                            speculative = {'speculative_config': {'model': LLAMA_DRAFT_MODEL, 'num_speculative_tokens': LLAMA_NUM_SPECULATIVE_TOKENS}}
+                    engine_args = EngineArgs(
+                        model=LLAMA_MODEL_PATH,
+                        dtype=str(llama_dtype).replace('torch.', ''),
+                        quantization=None if LLAMA_QUANTIZATION == 'none' else LLAMA_QUANTIZATION,
+                        gpu_memory_utilization=VLLM_GPU_MEMORY_UTILIZATION,
+                        max_model_len=2048,
+                        enable_prefix_caching=True,
+                        **speculative
+                    )
+                    llm_engine = ContinuousBatchingEngine(LLMEngine.from_engine_args(engine_args))
+                    logger.info("✅ Llama-3.1-8B-Instruct vLLM engine ready")
+                except Exception as e:
+                    logger.warning(f"⚠️ vLLM backend unavailable, using transformers pipeline: {e}")
+                    llm_engine = None
+            
+            # Load Llama model for text generation
+            if llm_engine is None:
+                try:
+                    logger.info("📥 Loading Llama-3.1-8B-Instruct model...")
+                    # Quantized weights need a GPU and are placed by accelerate
+                    quantized = LLAMA_QUANTIZATION != 'none' and torch.cuda.is_available()
+                    # Load weights straight into place instead of over a randomly initialized copy (half the peak RAM)
+                    model_kwargs = {'attn_implementation': select_attention_implementation(torch), 'low_cpu_mem_usage': True}
+                    if quantized and LLAMA_QUANTIZATION == 'fp8':
+                        from transformers import FbgemmFp8Config
+                        model_kwargs['quantization_config'] = FbgemmFp8Config()
+                    placement = {'device_map': "auto"} if quantized else {'device': device}
+                    
+                    qwen_pipeline = pipeline(
+                        "text-generation",
+                        model=LLAMA_MODEL_PATH,
+                        torch_dtype=llama_dtype,
+                        trust_remote_code=True,
+                        model_kwargs=model_kwargs,
+                        max_length=2048,
+                        padding=True,
+                        truncation=True,
+                        **placement
+                    )
+                    if quantized:
+                        logger.info(f"🗜️ Llama weights quantized with {LLAMA_QUANTIZATION.upper()}")
+                    logger.info(f"⚡ Attention implementation: {model_kwargs['attn_implementation']}")
+                    
+                    # Batched prompts are padded by hand in generate_with_transformers
+                    if qwen_pipeline.tokenizer.pad_token is None:
+                        qwen_pipeline.tokenizer.pad_token = qwen_pipeline.tokenizer.eos_token
+                    logger.info("✅ Llama-3.1-8B-Instruct model loaded successfully")
+                    
+                    if LLAMA_DRAFT_MODEL:
+                        try:
+                            from transformers import AutoModelForCausalLM
+                            logger.info(f"📥 Loading draft model {LLAMA_DRAFT_MODEL} for assisted generation...")
+                            draft_model = AutoModelForCausalLM.from_pretrained(
+                                LLAMA_DRAFT_MODEL,
+                                torch_dtype=llama_dtype,
+                                attn_implementation=model_kwargs['attn_implementation']
+                            ).to(qwen_pipeline.model.device)
+                            logger.info("✅ Draft model loaded successfully")
+                        except Exception as e:
+                            logger.warning(f"⚠️ Failed to load draft model, decoding without speculation: {e}")
+                            draft_model = None
+                except Exception as e:
+                    logger.warning(f"⚠️ Failed to load Llama-3.1-8B model: {e}")
+                    # Fallback to smaller model
+                    qwen_pipeline = pipeline(
+                        "text-generation",
+                        model="distilgpt2",
+                        device=device,
+                        torch_dtype=dtype,
+                        max_length=512
+                    )
+                    logger.info("✅ Fallback text generation model loaded")
+            
+            # Prompts reach either backend as token ids; tokenize the chat template once up front
+            llama_tokenizer = llm_engine.engine.get_tokenizer() if llm_engine is not None else qwen_pipeline.tokenizer
+            prompt_segment_ids.clear()
+            encode_prompt_segments([LLAMA_PROMPT_HEADER, LLAMA_PROMPT_FOOTER])
+            
+            # Load summarization model
+            summarization_pipeline = None
+            if SUMMARIZATION_ONNX_PATH:
+                try:
+                    from optimum.onnxruntime import ORTModelForSeq2SeqLM
+                    from transformers import AutoTokenizer
+                    import onnxruntime
+                    if not os.path.isdir(SUMMARIZATION_ONNX_PATH):
+                        from export_bart_onnx import export
+                        logger.info(f"🗜️ No ONNX snapshot at {SUMMARIZATION_ONNX_PATH}, exporting {SUMMARIZATION_MODEL}...")
+                        export(SUMMARIZATION_ONNX_PATH)
+                    logger.info("📥 Loading ONNX INT8 summarization model (CPU)...")
+                    session_options = onnxruntime.SessionOptions()
+                    session_options.intra_op_num_threads = cpu_threads
+                    session_options.inter_op_num_threads = 1
+                    summarization_pipeline = pipeline(
+                        "summarization",
+                        model=ORTModelForSeq2SeqLM.from_pretrained(SUMMARIZATION_ONNX_PATH, session_options=session_options),
+                        tokenizer=AutoTokenizer.from_pretrained(SUMMARIZATION_ONNX_PATH),
+                        device=-1,
+                        max_length=1024,
+                        truncation=True
+                    )
+                    logger.info("✅ ONNX summarization model loaded successfully")
+                except Exception as e:
+                    logger.warning(f"⚠️ Failed to load ONNX BART model, using PyTorch: {e}")
+                    summarization_pipeline = None
+            
+            if summarization_pipeline is None:
+                try:
+                    logger.info("📥 Loading summarization model...")
+                    summarization_pipeline = pipeline(
+                        "summarization",
+                        model=SUMMARIZATION_MODEL,
+                        device=device,
+                        torch_dtype=dtype,
+                        max_length=1024,
+                        truncation=True
+                    )
+                    logger.info("✅ Summarization model loaded successfully")
+                except Exception as e:
+                    logger.warning(f"⚠️ Failed to load BART model: {e}")
+                    summarization_pipeline = None
+            
+            # Load sentiment analysis model for context understanding
+            try:
+                logger.info("📥 Loading sentiment model...")
+                sentiment_pipeline = pipeline(
+                    "sentiment-analysis",
+                    model="cardiffnlp/twitter-roberta-base-sentiment-latest",
+                    device=device,
+                    torch_dtype=dtype
+                )
+                logger.info("✅ Sentiment model loaded successfully")
+            except Exception as e:
+                logger.warning(f"⚠️ Failed to load sentiment model: {e}")
+                sentiment_pipeline = None
+            
+            if AI_COMPILE:
+                compile_models()
+            warmup_models()
+            
+            models_loaded = True
+            logger.info("🎉 All models loaded successfully!")
+            return True
+            
         except Exception as e:
-            logger.warning(f"⚠️ Failed to load Llama-3.1-8B model: {e}")
-            # Fallback to smaller model
-            qwen_pipeline = pipeline(
-                "text-generation",
-                model="distilgpt2",
-                device=device,
-                max_length=512
-            )
-            logger.info("✅ Fallback text generation model loaded")
+            logger.error(f"❌ Critical error loading models: {e}")
+            return False
+
+def compile_models():
+    """Compile the transformers models and capture their graphs before serving traffic"""
+    global llama_compiled
+    try:
+        import torch
         
-        # Load summarization model
-        try:
-            logger.info("📥 Loading summarization model...")
-            summarization_pipeline = pipeline(
-                "summarization",
-                model="facebook/bart-large-cnn",
-                device=device,
-                torch_dtype=torch.float16 if torch.cuda.is_available() else torch.float32,
-                max_length=1024,
-                truncation=True
-            )
-            logger.info("✅ Summarization model loaded successfully")
-        except Exception as e:
-            logger.warning(f"⚠️ Failed to load BART model: {e}")
-            summarization_pipeline = None
+        if qwen_pipeline is not None and torch.cuda.is_available():
+            logger.info("⚙️ Compiling text generation model...")
+            # CUDA graph capture needs static shapes, so decode against a fixed-size KV cache
+            qwen_pipeline.model.generation_config.cache_implementation = "static"
+            qwen_pipeline.model.forward = torch.compile(qwen_pipeline.model.forward, mode="reduce-overhead", fullgraph=False)
+            llama_compiled = True
         
-        # Load sentiment analysis model for context understanding
-        try:
-            logger.info("📥 Loading sentiment model...")
-            sentiment_pipeline = pipeline(
-                "sentiment-analysis",
-                model="cardiffnlp/twitter-roberta-base-sentiment-latest",
-                device=device
-            )
-            logger.info("✅ Sentiment model loaded successfully")
-        except Exception as e:
-            logger.warning(f"⚠️ Failed to load sentiment model: {e}")
-            sentiment_pipeline = None
+        # ONNX Runtime models have no PyTorch forward to compile
+        if summarization_pipeline is not None and hasattr(summarization_pipeline.model, 'parameters'):
+            logger.info("⚙️ Compiling summarization model...")
+            # generate() runs the encoder through get_encoder() once per batch, then forward() per decoder
+            # step; input lengths and beam counts vary, so compile both for dynamic shapes
+            encoder = summarization_pipeline.model.get_encoder()
+            encoder.forward = torch.compile(encoder.forward, dynamic=True)
+            summarization_pipeline.model.forward = torch.compile(summarization_pipeline.model.forward, dynamic=True)
         
-        models_loaded = True
-        logger.info("🎉 All models loaded successfully!")
-        return True
+        logger.info("✅ Models compiled; graphs are captured during warmup")
+    except Exception as e:
+        logger.warning(f"⚠️ torch.compile failed, continuing in eager mode: {e}")
+
+def warmup_models():
+    """Run representative requests once so the first real request doesn't pay for one-time work.
+
+    Without AI_COMPILE this is one short generation and one summary (CUDA context,
+    cuBLAS algorithm selection, lazy initialization). A compiled Llama also captures a
+    graph per generation bucket and runs the batched analysis path, and a compiled BART
+    summarizes two input lengths so its graphs are specialized for dynamic shapes. Kept
+    short otherwise: on CPU it runs within gunicorn's WORKER_TIMEOUT.
+    """
+    try:
+        start_time = time.time()
+        sentence = "TechCorp revenue grew 12% year over year to $4.2M while operating costs fell 5%. "
+        
+        if llama_compiled:
+            for bucket in GENERATION_BUCKETS:
+                generate_with_llama("Summarize: revenue grew 12% year over year.", bucket, 0.7)
+            analyze_document_batched(sentence * 30, 150, 10)
+        elif llm_engine is not None or qwen_pipeline is not None:
+            generate_with_llama("Summarize: revenue grew 12% year over year.", 16, 0.7)
+        for repeat in ((5, 15) if AI_COMPILE else (5,)):
+            summarize_text(sentence * repeat, 32)
         
+        logger.info(f"🔥 Models warmed up in {time.time() - start_time:.1f}s")
     except Exception as e:
-        logger.error(f"❌ Critical error loading models: {e}")
-        return False
+        logger.warning(f"⚠️ Warmup failed, first requests may be slower: {e}")
+
+def bucket_power_of_two(size, smallest):
+    """Round size up to smallest times a power of two"""
+    bucket = smallest
+    while bucket < size:
+        bucket *= 2
+    return bucket
+
+def bucket_max_new_tokens(max_length):
+    """Round a generation length up to the nearest compiled bucket"""
+    for bucket in GENERATION_BUCKETS:
+        if max_length <= bucket:
+            return bucket
+    return max_length
 
 def clean_generated_text(text, original_prompt=""):
     """Clean and filter generated text to remove repetition and improve quality"""
@@ -122,188 +672,661 @@ def clean_generated_text(text, original_prompt=""):
     if original_prompt and text.startswith(original_prompt):
         text = text[len(original_prompt):].strip()
     
-    # Split into sentences and remove duplicates while preserving order
-    sentences = [s.strip() for s in text.split('.') if s.strip()]
-    unique_sentences = []
-    seen = set()
+    # Split into sentences, keeping those above the minimum sentence length
+    sentences = [s for s in map(str.strip, text.split('.')) if len(s) > 10]
     
+    # Remove duplicates while preserving order (normalized: lowercase, single spaces)
+    unique_sentences = {}
     for sentence in sentences:
-        # Normalize for comparison (lowercase, remove extra spaces)
-        normalized = ' '.join(sentence.lower().split())
-        if normalized not in seen and len(sentence) > 10:  # Minimum sentence length
-            unique_sentences.append(sentence)
-            seen.add(normalized)
+        unique_sentences.setdefault(' '.join(sentence.lower().split()), sentence)
     
     # Join sentences and ensure proper punctuation
-    result = '. '.join(unique_sentences)
+    result = '. '.join(unique_sentences.values())
     if result and not result.endswith('.'):
         result += '.'
     
     return result
 
-def generate_with_llama(prompt, max_length=200, temperature=0.7):
-    """Generate text using Llama or fallback model with improved quality"""
+def llama_prompt_segments(prompt):
+    """Split a task prompt wrapped in the Llama-3 chat template into separately tokenizable segments.
+
+    Document prompts are (document_block, task) tuples, so the document excerpt they
+    share is one segment and gets tokenized once per document rather than once per prompt.
+    """
+    return (LLAMA_PROMPT_HEADER,) + (prompt if isinstance(prompt, tuple) else (prompt,)) + (LLAMA_PROMPT_FOOTER,)
+
+def format_llama_prompt(prompt):
+    """Wrap a task prompt in the Llama-3 chat template"""
+    return ''.join(llama_prompt_segments(prompt))
+
+def encode_prompt_segments(segments):
+    """Token ids of prompt segments (chat template text, document excerpts, tasks), served from an LRU cache.
+
+    Segments not cached yet are tokenized in one batch call, which the Rust fast tokenizer
+    spreads across cores without holding the GIL, so other request threads keep running.
+    """
+    with prompt_segment_lock:
+        ids = {}
+        for segment in segments:
+            if segment in prompt_segment_ids:
+                prompt_segment_ids.move_to_end(segment)
+                ids[segment] = prompt_segment_ids[segment]
+    
+    missing = [segment for segment in dict.fromkeys(segments) if segment not in ids]
+    if missing:
+        encoded = [tuple(input_ids) for input_ids in llama_tokenizer(missing, add_special_tokens=False).input_ids]
+        ids.update(zip(missing, encoded))
+        with prompt_segment_lock:
+            prompt_segment_ids.update(zip(missing, encoded))
+            while len(prompt_segment_ids) > PROMPT_SEGMENT_CACHE_SIZE:
+                prompt_segment_ids.popitem(last=False)
+    
+    return [ids[segment] for segment in segments]
+
+def encode_llama_prompts(prompts):
+    """Token ids of task prompts wrapped in the chat template, built from cached segment ids"""
+    segments = [llama_prompt_segments(prompt) for prompt in prompts]
+    segment_ids = iter(encode_prompt_segments([segment for prompt_segments in segments for segment in prompt_segments]))
+    return [list(itertools.chain.from_iterable(itertools.islice(segment_ids, len(prompt_segments)))) for prompt_segments in segments]
+
+def encode_llama_prompt(prompt):
+    """Token ids of one task prompt wrapped in the chat template"""
+    return encode_llama_prompts([prompt])[0]
+
+# Placeholder responses when generation fails or comes back empty; analyses built on them aren't cached
+LLAMA_FALLBACK_RESPONSE = "Analysis completed with limited AI processing capabilities."
+LLAMA_EMPTY_RESPONSE = "Analysis completed with AI processing."
+FALLBACK_RESPONSES = frozenset({LLAMA_FALLBACK_RESPONSE, LLAMA_EMPTY_RESPONSE})
+
+def generate_batch_with_llama(requests):
+    """Generate text for several (prompt, max_length, temperature) requests in one backend call"""
+    if not requests:
+        return []
+    
     try:
-        if qwen_pipeline is None:
+        if llm_engine is None and qwen_pipeline is None:
             raise Exception("Text generation model not available")
         
-        # Create a Llama-compatible structured prompt
-        structured_prompt = f"<|begin_of_text|><|start_header_id|>system<|end_header_id|>\nYou are an expert business analyst. Provide concise, professional analysis.<|eot_id|><|start_header_id|>user<|end_header_id|>\n{prompt}<|eot_id|><|start_header_id|>assistant<|end_header_id|>\n"
+        structured_prompts = [format_llama_prompt(prompt) for prompt, _, _ in requests]
         
-        result = qwen_pipeline(
-            structured_prompt,
-            max_new_tokens=max_length,
-            temperature=temperature,
-            do_sample=True,
-            return_full_text=False,
-            pad_token_id=qwen_pipeline.tokenizer.eos_token_id,
-            repetition_penalty=1.2,
-            no_repeat_ngram_size=3
-        )
-        
-        generated_text = result[0]['generated_text'].strip()
+        if llm_engine is not None:
+            from vllm import SamplingParams
+            sampling_params = [
+                SamplingParams(max_tokens=max_length, temperature=temperature, repetition_penalty=1.2)
+                for _, max_length, temperature in requests
+            ]
+            generated_texts = llm_engine.generate(
+                [{'prompt_token_ids': ids} for ids in encode_llama_prompts([prompt for prompt, _, _ in requests])],
+                sampling_params
+            )
+        else:
+            # Tokenize before taking a generation slot so the slot is only held for generate()
+            encoded = encode_llama_prompts([prompt for prompt, _, _ in requests])
+            with generation_slots:
+                generated_texts = generate_with_transformers(
+                    encoded,
+                    [max_length for _, max_length, _ in requests],
+                    [temperature for _, _, temperature in requests]
+                )
         
         # Clean and filter the generated text
-        cleaned_text = clean_generated_text(generated_text, structured_prompt)
-        
-        return cleaned_text if cleaned_text else "Analysis completed with AI processing."
+        responses = []
+        for generated_text, structured_prompt in zip(generated_texts, structured_prompts):
+            cleaned_text = clean_generated_text(generated_text.strip(), structured_prompt)
+            responses.append(cleaned_text if cleaned_text else LLAMA_EMPTY_RESPONSE)
+        return responses
         
     except Exception as e:
         logger.error(f"Text generation error: {e}")
-        return "Analysis completed with limited AI processing capabilities."
+        return [LLAMA_FALLBACK_RESPONSE] * len(requests)
+
+def common_prefix_length(sequences):
+    """Number of leading token ids shared by every sequence"""
+    length = 0
+    for tokens in zip(*sequences):
+        if any(token != tokens[0] for token in tokens[1:]):
+            break
+        length += 1
+    return length
+
+def generate_with_transformers(encoded, max_lengths, temperatures):
+    """Run one batched model.generate() call on token-id prompts, prefilling their shared prefix once"""
+    import torch
+    from transformers import DynamicCache, LogitsProcessorList
+    
+    tokenizer = qwen_pipeline.tokenizer
+    model = qwen_pipeline.model
+    row_count = len(encoded)
+    
+    # Every row must keep at least one uncached token to feed generate()
+    prefix_length = min(common_prefix_length(encoded), min(len(ids) for ids in encoded) - 1)
+    reuse_prefix = (
+        len(encoded) > 1 and
+        prefix_length >= PREFIX_REUSE_MIN_TOKENS and
+        getattr(model, '_supports_cache_class', True) and
+        model.generation_config.cache_implementation != "static"
+    )
+    
+    past_key_values = None
+    if reuse_prefix:
+        # Prefill the shared prefix once and copy its KV cache to every row; rows are
+        # padded between prefix and suffix so the cached positions line up
+        with torch.inference_mode():
+            prefix_ids = torch.tensor([encoded[0][:prefix_length]], device=model.device)
+            past_key_values = model(prefix_ids, use_cache=True).past_key_values
+        if isinstance(past_key_values, tuple):
+            past_key_values = DynamicCache.from_legacy_cache(past_key_values)
+        past_key_values.batch_repeat_interleave(len(encoded))
+        suffix_width = max(len(ids) for ids in encoded) - prefix_length
+        rows, masks = [], []
+        for ids in encoded:
+            padding = suffix_width - (len(ids) - prefix_length)
+            rows.append(ids[:prefix_length] + [tokenizer.pad_token_id] * padding + ids[prefix_length:])
+            masks.append([1] * prefix_length + [0] * padding + [1] * (len(ids) - prefix_length))
+    else:
+        # Left-pad so batched prompts end at the same position and decode in lockstep
+        width = max(len(ids) for ids in encoded)
+        if llama_compiled:
+            # The static cache is sized batch x (prompt + new tokens) and every new shape
+            # recompiles, so pad the width to a bucket and the batch with copies of the last row
+            width = bucket_power_of_two(width, PROMPT_BUCKET_MIN)
+            padding_rows = bucket_power_of_two(len(encoded), 1) - len(encoded)
+            encoded = encoded + [encoded[-1]] * padding_rows
+            max_lengths = max_lengths + [max_lengths[-1]] * padding_rows
+            temperatures = temperatures + [temperatures[-1]] * padding_rows
+        rows = [[tokenizer.pad_token_id] * (width - len(ids)) + ids for ids in encoded]
+        masks = [[0] * (width - len(ids)) + [1] * len(ids) for ids in encoded]
+    
+    input_ids = torch.tensor(rows, device=model.device)
+    batch_controls = BatchSamplingControls(temperatures, max_lengths, tokenizer.eos_token_id)
+    
+    # transformers' assisted generation only decodes one sequence at a time, so the draft
+    # model speeds up single-prompt calls and batches keep plain batched decoding
+    speculative = {}
+    if draft_model is not None and len(encoded) == 1 and model.generation_config.cache_implementation != "static":
+        speculative = {'assistant_model': draft_model}
+    
+    with torch.inference_mode():
+        outputs = model.generate(
+            input_ids=input_ids,
+            attention_mask=torch.tensor(masks, device=model.device),
+            past_key_values=past_key_values,
+            **speculative,
+            max_new_tokens=bucket_max_new_tokens(max(max_lengths)),
+            temperature=1.0,  # per-row temperatures are applied by batch_controls
+            do_sample=True,
+            pad_token_id=tokenizer.pad_token_id,
+            repetition_penalty=1.2,
+            no_repeat_ngram_size=3,
+            logits_processor=LogitsProcessorList([batch_controls])
+        )
+    
+    return tokenizer.batch_decode(outputs[:row_count, input_ids.shape[1]:], skip_special_tokens=True)
+
+def generate_with_llama(prompt, max_length=200, temperature=0.7):
+    """Generate text using Llama or fallback model with improved quality"""
+    return generate_batch_with_llama([(prompt, max_length, temperature)])[0]
+
+def summary_uses_llama(text):
+    """Whether summarize_text routes this document to Llama rather than BART"""
+    if not text or len(text.strip()) < 50:
+        return False
+    clean_text = WHITESPACE_RE.sub(' ', text.strip())
+    return not (summarization_pipeline and len(clean_text) > 100)
+
+def document_block(text):
+    """Document excerpt that opens every document-based prompt (kept identical for prefix reuse).
+
+    Prompt builders return it as the first element of a (document_block, task) tuple.
+    """
+    return f"DOCUMENT:\n{text.strip()[:DOCUMENT_EXCERPT_CHARS]}\n\n"
+
+def build_summary_prompt(text, max_length):
+    """Build the Llama summarization prompt"""
+    return document_block(text), f"Summarize this business document in exactly {max_length} words or less. Focus on key facts and numbers.\n\nConcise summary:"
+
+def item_fallback(fallback, *item):
+    """Run a per-item fallback as a (result, True) slot, returning its exception instead of raising so one bad item can't fail its whole batch"""
+    try:
+        return fallback(*item), True
+    except Exception as e:
+        return e
+
+def batch_item(slot):
+    """Raise a batch slot's exception, otherwise return its (result, fallback) pair"""
+    if isinstance(slot, Exception):
+        raise slot
+    return slot
 
 def summarize_text(text, max_length=150):
     """Summarize text using BART with improved quality"""
-    try:
-        if not text or len(text.strip()) < 50:
-            return "Document too short for summarization."
-        
-        # Clean and prepare text
-        clean_text = re.sub(r'\s+', ' ', text.strip())
+    return batch_item(summarize_texts([(text, max_length)])[0])[0]
+
+def summarize_texts(items):
+    """Summarize several (text, max_length) items: one BART call per group sharing length settings, one Llama batch for the rest.
+
+    Returns one (summary, fallback) pair per item, fallback being True for extractive or placeholder
+    summaries that shouldn't be cached, or the exception for an item even the fallback couldn't handle.
+    """
+    summaries = [None] * len(items)
+    bart_groups = {}
+    llama_items = []
+    bart_items = []
+    
+    for index, (text, max_length) in enumerate(items):
+        try:
+            if not text or len(text.strip()) < 50:
+                summaries[index] = ("Document too short for summarization.", False)
+                continue
+            
+            # Clean and prepare text
+            clean_text = WHITESPACE_RE.sub(' ', text.strip())
+            
+            if summarization_pipeline and len(clean_text) > 100:
+                # Use BART for summarization
+                bart_items.append((index, clean_text))
+            else:
+                # Use Llama for summarization
+                llama_items.append(index)
+        except Exception as e:
+            logger.error(f"Summarization error: {e}")
+            summaries[index] = item_fallback(extractive_summary, text, max_length)
+    
+    if bart_items:
+        try:
+            input_texts = condense_to_summary_window([clean_text for _, clean_text in bart_items])
+        except Exception as e:
+            logger.error(f"Summarization error: {e}")
+            input_texts = [None] * len(bart_items)
         
-        if summarization_pipeline and len(clean_text) > 100:
-            # Use BART for summarization with proper length constraints
-            input_text = clean_text[:1024]  # BART input limit
+        for (index, _), input_text in zip(bart_items, input_texts):
+            try:
+                if input_text is None:
+                    raise ValueError("Document could not be condensed")
+                # Length constraints relative to the (condensed) input
+                max_length = items[index][1]
+                settings = (min(max_length, len(input_text.split()) // 2), max(30, max_length // 4))
+                bart_groups.setdefault(settings, []).append((index, input_text))
+            except Exception as e:
+                logger.error(f"Summarization error: {e}")
+                summaries[index] = item_fallback(extractive_summary, *items[index])
+    
+    for (bart_max_length, bart_min_length), group in bart_groups.items():
+        try:
+            with generation_slots:
+                results = summarization_pipeline(
+                    [input_text for _, input_text in group],
+                    batch_size=len(group),
+                    max_length=bart_max_length,
+                    min_length=bart_min_length,
+                    do_sample=False,
+                    length_penalty=1.0,
+                    no_repeat_ngram_size=3,
+                    **({'num_beams': SUMMARIZATION_NUM_BEAMS} if SUMMARIZATION_NUM_BEAMS else {})
+                )
             
-            result = summarization_pipeline(
-                input_text,
-                max_length=min(max_length, len(input_text.split()) // 2),
-                min_length=max(30, max_length // 4),
+            for (index, input_text), result in zip(group, results):
+                # Clean up the summary
+                summary = clean_generated_text(result['summary_text'])
+                summaries[index] = (summary, False) if summary else (input_text[:items[index][1]] + "...", True)
+        except Exception as e:
+            logger.error(f"Summarization error: {e}")
+            for index, _ in group:
+                summaries[index] = item_fallback(extractive_summary, *items[index])
+    
+    # Prompts are built per item so a malformed item falls back alone
+    llama_requests = []
+    for index in llama_items:
+        text, max_length = items[index]
+        try:
+            llama_requests.append((index, (build_summary_prompt(text, max_length), max_length // 2, 0.3)))
+        except Exception as e:
+            logger.error(f"Summarization error: {e}")
+            summaries[index] = item_fallback(extractive_summary, text, max_length)
+    
+    if llama_requests:
+        responses = generate_batch_with_llama([request for _, request in llama_requests])
+        for (index, _), response in zip(llama_requests, responses):
+            summaries[index] = (response, response in FALLBACK_RESPONSES)
+    
+    return summaries
+
+def split_summary_windows(text):
+    """Split text into overlapping windows that BART reads whole ([text] when it already fits)"""
+    tokenizer = summarization_pipeline.tokenizer
+    window = min(tokenizer.model_max_length, 1024) - 2  # Room for <s> and </s>
+    ids = tokenizer(text, add_special_tokens=False).input_ids
+    if len(ids) <= window:
+        return [text]
+    
+    stride = window - SUMMARY_CHUNK_OVERLAP
+    return [tokenizer.decode(ids[start:start + window]) for start in range(0, len(ids) - SUMMARY_CHUNK_OVERLAP, stride)]
+
+def condense_to_summary_window(texts):
+    """Map step of map-reduce summarization.
+
+    Every window of every text that doesn't fit BART's input is summarized in one
+    batched call and the partial summaries are joined, repeating until each text fits
+    one window. Texts that already fit are returned unchanged.
+    """
+    windows = [split_summary_windows(text) for text in texts]
+    while any(len(text_windows) > 1 for text_windows in windows):
+        long_texts = [index for index, text_windows in enumerate(windows) if len(text_windows) > 1]
+        batch = [window for index in long_texts for window in windows[index]]
+        logger.info(f"🧩 Summarizing {len(batch)} windows of {len(long_texts)} long document(s)")
+        with generation_slots:
+            results = summarization_pipeline(
+                batch,
+                batch_size=min(len(batch), AI_BATCH_MAX),
+                max_length=SUMMARY_CHUNK_MAX_TOKENS,
+                min_length=min(30, SUMMARY_CHUNK_MAX_TOKENS // 2),
                 do_sample=False,
-                length_penalty=1.0,
-                no_repeat_ngram_size=3
+                no_repeat_ngram_size=3,
+                **({'num_beams': SUMMARIZATION_NUM_BEAMS} if SUMMARIZATION_NUM_BEAMS else {})
             )
-            
-            summary = result[0]['summary_text']
-            
-            # Clean up the summary
-            summary = clean_generated_text(summary)
-            return summary if summary else input_text[:max_length] + "..."
-            
-        else:
-            # Use Llama for summarization
-            prompt = f"Summarize this business document in exactly {max_length} words or less. Focus on key facts and numbers:\n\n{clean_text[:1000]}\n\nConcise summary:"
-            return generate_with_llama(prompt, max_length//2, 0.3)
-            
+        
+        partials = iter(clean_generated_text(result['summary_text']) for result in results)
+        for index in long_texts:
+            windows[index] = split_summary_windows(' '.join(itertools.islice(partials, len(windows[index]))))
+    
+    return [text_windows[0] for text_windows in windows]
+
+def iter_summary_stream(text, max_length):
+    """Yield ('token', text) chunks as BART decodes, then ('summary', cleaned summary), or ('fallback', summary) when it isn't a model summary.
+
+    Texts that summarize_texts wouldn't send to BART are summarized in one piece. Streaming
+    needs greedy decoding, since generate() can't stream beam search.
+    """
+    clean_text = WHITESPACE_RE.sub(' ', text.strip()) if text else ''
+    if not (summarization_pipeline and len(text.strip()) >= 50 and len(clean_text) > 100):
+        summary, fallback = batch_item(summarize_texts([(text, max_length)])[0])
+        yield ('fallback' if fallback else 'summary'), summary
+        return
+    
+    from transformers import TextIteratorStreamer
+    try:
+        # Long documents are condensed first; only the final summary streams
+        input_text = condense_to_summary_window([clean_text])[0]
     except Exception as e:
         logger.error(f"Summarization error: {e}")
-        # Basic extractive summarization fallback
-        sentences = [s.strip() for s in text.split('.') if len(s.strip()) > 20][:3]
-        return '. '.join(sentences)[:max_length] + ('.' if not '. '.join(sentences)[:max_length].endswith('.') else '')
-
-def extract_keywords(text, max_keywords=10):
-    """Extract keywords using AI with improved prompting"""
+        yield 'fallback', extractive_summary(text, max_length)
+        return
+    streamer = TextIteratorStreamer(summarization_pipeline.tokenizer, skip_prompt=True, skip_special_tokens=True)
+    summary_text = Future()
+    
+    def generate():
+        try:
+            with generation_slots:
+                result = summarization_pipeline(
+                    input_text,
+                    max_length=min(max_length, len(input_text.split()) // 2),
+                    min_length=max(30, max_length // 4),
+                    do_sample=False,
+                    num_beams=1,
+                    length_penalty=1.0,
+                    no_repeat_ngram_size=3,
+                    streamer=streamer
+                )
+            summary_text.set_result(result[0]['summary_text'])
+        except Exception as e:
+            summary_text.set_exception(e)
+            streamer.end()  # Release the consumer waiting on the streamer
+    
+    threading.Thread(target=generate, name="summary-stream", daemon=True).start()
+    for chunk in streamer:
+        if chunk:
+            yield 'token', chunk
+    
     try:
-        # Clean text
-        clean_text = re.sub(r'\s+', ' ', text.strip())
-        
-        prompt = f"""Extract {max_keywords} important business keywords from this document.
+        summary = clean_generated_text(summary_text.result())
+    except Exception as e:
+        logger.error(f"Summarization error: {e}")
+        yield 'fallback', extractive_summary(text, max_length)
+        return
+    if summary:
+        yield 'summary', summary
+    else:
+        yield 'fallback', input_text[:max_length] + "..."
+
+
+def extractive_summary(text, max_length):
+    """Basic extractive summarization fallback (stops scanning after the first three sentences)"""
+    sentences = (match.group().strip() for match in SENTENCE_RE.finditer(text))
+    summary = '. '.join(itertools.islice((s for s in sentences if len(s) > 20), 3))[:max_length]
+    return summary + ('.' if not summary.endswith('.') else '')
+
+def build_keywords_prompt(text, max_keywords):
+    """Build the keyword extraction prompt"""
+    return document_block(text), f"""Extract {max_keywords} important business keywords from this document.
 Rules:
 - Focus on business terms, products, metrics, companies, strategies
 - Return ONLY keywords separated by commas
 - No explanations or extra text
 - Keywords should be 1-3 words each
 
-Document: {clean_text[:1200]}
-
 Business keywords:"""
+
+def parse_keywords_response(response, text, max_keywords):
+    """Parse the comma-separated keyword response, falling back to pattern-based extraction"""
+    if response:
+        # Parse keywords more carefully
+        # Remove common prefixes and clean up
+        response = KEYWORDS_PREFIX_RE.sub('', response.lower().strip())
+        keywords = [k.strip() for k in response.split(',') if k.strip()]
         
-        response = generate_with_llama(prompt, 100, 0.2)
-        
-        if response:
-            # Parse keywords more carefully
-            # Remove common prefixes and clean up
-            response = re.sub(r'^(keywords?:?\s*)', '', response.lower().strip())
-            keywords = [k.strip() for k in response.split(',') if k.strip()]
-            
-            # Filter keywords
-            filtered_keywords = []
-            for keyword in keywords:
-                # Clean keyword
-                keyword = re.sub(r'[^\w\s-]', '', keyword).strip()
-                if (len(keyword) >= 2 and len(keyword) <= 25 and 
-                    not keyword.isdigit() and 
-                    keyword not in ['document', 'business', 'analysis', 'data']):
-                    filtered_keywords.append(keyword)
-            
-            if filtered_keywords:
-                return filtered_keywords[:max_keywords]
-        
-        # Fallback to pattern-based extraction
-        return extract_keywords_basic(text, max_keywords)
+        # Filter keywords
+        filtered_keywords = []
+        for keyword in keywords:
+            # Clean keyword
+            keyword = KEYWORD_PUNCTUATION_RE.sub('', keyword).strip()
+            if (len(keyword) >= 2 and len(keyword) <= 25 and 
+                not keyword.isdigit() and 
+                keyword not in ['document', 'business', 'analysis', 'data']):
+                filtered_keywords.append(keyword)
         
+        if filtered_keywords:
+            return filtered_keywords[:max_keywords]
+    
+    # Fallback to pattern-based extraction
+    return extract_keywords_basic(text, max_keywords)
+
+def extract_keywords(text, max_keywords=10):
+    """Extract keywords using AI with improved prompting"""
+    return batch_item(extract_keywords_batch([(text, max_keywords)])[0])[0]
+
+def extract_keywords_batch(items):
+    """Extract keywords for several (text, max_keywords) items with one batched Llama call.
+
+    Returns one (keywords, fallback) pair per item, fallback being True for pattern-based keywords
+    used because generation failed, or the exception for an item even the fallback couldn't handle.
+    """
+    keywords = [None] * len(items)
+    
+    # Prompts are built per item so a malformed item falls back alone
+    llama_requests = []
+    for index, (text, max_keywords) in enumerate(items):
+        try:
+            llama_requests.append((index, (build_keywords_prompt(text, max_keywords), 100, 0.2)))
+        except Exception as e:
+            logger.error(f"Keyword extraction error: {e}")
+            keywords[index] = item_fallback(extract_keywords_basic, text, max_keywords)
+    
+    try:
+        responses = generate_batch_with_llama([request for _, request in llama_requests])
     except Exception as e:
         logger.error(f"Keyword extraction error: {e}")
-        return extract_keywords_basic(text, max_keywords)
+        responses = [None] * len(llama_requests)
+    
+    for (index, _), response in zip(llama_requests, responses):
+        text, max_keywords = items[index]
+        try:
+            keywords[index] = (parse_keywords_response(response, text, max_keywords), response is None or response in FALLBACK_RESPONSES)
+        except Exception as e:
+            logger.error(f"Keyword extraction error: {e}")
+            keywords[index] = item_fallback(extract_keywords_basic, text, max_keywords)
+    return keywords
 
-def extract_keywords_basic(text, max_keywords):
-    """Enhanced basic keyword extraction"""
-    stop_words = {
-        'the', 'a', 'an', 'and', 'or', 'but', 'in', 'on', 'at', 'to', 'for', 'of', 'with', 'by',
-        'is', 'are', 'was', 'were', 'be', 'been', 'have', 'has', 'had', 'do', 'does', 'did',
-        'will', 'would', 'could', 'should', 'this', 'that', 'these', 'those', 'they', 'them',
-        'their', 'there', 'then', 'than', 'from', 'into', 'over', 'under', 'about', 'through'
-    }
+# Business vocabulary, matched as whole words
+BUSINESS_TERMS = [
+    'revenue', 'profit', 'sales', 'growth', 'market', 'customer', 'product', 'service', 'strategy',
+    'technology', 'digital', 'platform', 'solution', 'system', 'process', 'management',
+    'development', 'innovation', 'performance', 'efficiency', 'quality', 'experience',
+    'engagement', 'acquisition', 'retention', 'conversion', 'optimization', 'analysis', 'data',
+    'insights', 'metrics', 'KPI', 'ROI', 'budget', 'cost', 'investment', 'funding', 'partnership',
+    'collaboration', 'expansion', 'launch', 'implementation', 'integration', 'transformation',
+    'upgrade', 'enhancement', 'improvement', 'increase', 'decrease', 'trend', 'forecast', 'target',
+    'goal', 'objective', 'initiative', 'project', 'campaign', 'program', 'framework',
+    'methodology', 'approach', 'best practices', 'competitive advantage', 'value proposition',
+    'market share', 'customer satisfaction', 'user experience', 'brand recognition',
+    'operational excellence', 'scalability', 'sustainability', 'compliance', 'security',
+    'risk management'
+]
+
+# Potential business terms for extract_keywords_basic, matched case-insensitively. The vocabulary
+# alternation lists longer terms first, so re's and RE2's leftmost-first match is also the
+# leftmost-longest one that Hyperscan and find_business_vocabulary pick ("market share", not
+# "market"); keep that order if the vocabulary is ever built differently
+BUSINESS_PATTERNS = [
+    r'\b[A-Z][a-z]+(?:\s+[A-Z][a-z]+)*\b',  # Proper nouns
+    r'\b\w+(?:Corp|Inc|LLC|Ltd|Company|Co)\b',  # Companies
+    r'\b\w+(?:tion|ment|ness|ity|ing)\b',  # Business terms
+    r'\b(?:' + '|'.join(sorted(BUSINESS_TERMS, key=len, reverse=True)) + r')\b'  # Business vocabulary
+]
+
+def build_business_term_scanner():
+    """Compile BUSINESS_PATTERNS with the fastest available engine.
+
+    Hyperscan scans the text once for all patterns; google-re2 and then the
+    stdlib re are fallbacks when it is not installed. Hyperscan and RE2 treat \\w as
+    ASCII-only, so find_business_terms sends non-ASCII text to the stdlib patterns.
+    """
+    try:
+        import hyperscan
+        database = hyperscan.Database()
+        database.compile(
+            expressions=[p.encode() for p in BUSINESS_PATTERNS],
+            ids=list(range(len(BUSINESS_PATTERNS))),
+            elements=len(BUSINESS_PATTERNS),
+            flags=[hyperscan.HS_FLAG_CASELESS | hyperscan.HS_FLAG_SOM_LEFTMOST] * len(BUSINESS_PATTERNS)
+        )
+        return 'hyperscan', database
+    except Exception:
+        pass
     
-    # Extract potential business terms
-    business_patterns = [
-        r'\b[A-Z][a-z]+(?:\s+[A-Z][a-z]+)*\b',  # Proper nouns
-        r'\b\w+(?:Corp|Inc|LLC|Ltd|Company|Co)\b',  # Companies
-        r'\b\w+(?:tion|ment|ness|ity|ing)\b',  # Business terms
-        r'\b(?:revenue|profit|sales|growth|market|customer|product|service|strategy|technology|digital|platform|solution|system|process|management|development|innovation|performance|efficiency|quality|experience|engagement|acquisition|retention|conversion|optimization|analysis|data|insights|metrics|KPI|ROI|budget|cost|investment|funding|partnership|collaboration|expansion|launch|implementation|integration|transformation|upgrade|enhancement|improvement|increase|decrease|trend|forecast|target|goal|objective|initiative|project|campaign|program|framework|methodology|approach|best practices|competitive advantage|value proposition|market share|customer satisfaction|user experience|brand recognition|operational excellence|scalability|sustainability|compliance|security|risk management)\b'
-    ]
+    try:
+        import re2
+        return 're2', [re2.compile('(?i)' + p) for p in BUSINESS_PATTERNS]
+    except Exception:
+        return 're', BUSINESS_PATTERNS_RE
+
+def build_business_term_automaton():
+    """Aho-Corasick automaton over the lowercased BUSINESS_TERMS (None without pyahocorasick)"""
+    if ahocorasick is None:
+        return None
     
-    keywords = set()
-    for pattern in business_patterns:
-        matches = re.findall(pattern, text, re.IGNORECASE)
-        for match in matches:
-            if isinstance(match, str):
-                clean_match = match.lower().strip()
-                if (len(clean_match) >= 3 and len(clean_match) <= 25 and 
-                    clean_match not in stop_words and clean_match.replace(' ', '').isalpha()):
-                    keywords.add(clean_match)
+    automaton = ahocorasick.Automaton()
+    for term in BUSINESS_TERMS:
+        automaton.add_word(term.lower(), len(term))
+    automaton.make_automaton()
+    return automaton
+
+BUSINESS_PATTERNS_RE = [re.compile(p, re.IGNORECASE) for p in BUSINESS_PATTERNS]
+business_term_engine, business_term_scanner = build_business_term_scanner()
+business_term_automaton = build_business_term_automaton()
+hyperscan_scratch = threading.local()  # Hyperscan scratch space must not be shared across threads
+
+def find_business_terms(text):
+    """Return all BUSINESS_PATTERNS matches, pattern by pattern, leftmost-longest and non-overlapping.
+
+    That is what re.findall returns for these patterns (greedy, vocabulary ordered longest first),
+    so every engine yields the same matches.
+    """
+    if not text.isascii():
+        return [match for pattern in BUSINESS_PATTERNS_RE for match in pattern.findall(text)]
+    if business_term_engine != 'hyperscan':
+        if business_term_automaton is None:
+            return [match for pattern in business_term_scanner for match in pattern.findall(text)]
+        # The vocabulary alternation is the costly pattern for a backtracking engine; scan it as a trie instead
+        return [match for pattern in business_term_scanner[:-1] for match in pattern.findall(text)] + find_business_vocabulary(text)
     
-    # Word frequency as backup
-    words = re.findall(r'\b\w+\b', text.lower())
-    word_freq = {}
+    import hyperscan
+    if not hasattr(hyperscan_scratch, 'scratch'):
+        hyperscan_scratch.scratch = hyperscan.Scratch(business_term_scanner)
     
-    for word in words:
-        if len(word) > 3 and word not in stop_words and word.isalpha():
-            word_freq[word] = word_freq.get(word, 0) + 1
+    data = text.encode('ascii')
+    spans = []
+    business_term_scanner.scan(
+        data,
+        match_event_handler=lambda pattern_id, start, end, flags, context: spans.append((pattern_id, start, end)),
+        scratch=hyperscan_scratch.scratch
+    )
+    
+    # Hyperscan reports every match end; keep leftmost-longest, non-overlapping spans per pattern
+    matches = []
+    last_end = {}
+    for pattern_id, start, end in sorted(spans, key=lambda span: (span[0], span[1], -span[2])):
+        if start >= last_end.get(pattern_id, 0):
+            matches.append(data[start:end].decode())
+            last_end[pattern_id] = end
+    return matches
+
+def is_word_char(char):
+    """ASCII \\w"""
+    return char.isalnum() or char == '_'
+
+def find_business_vocabulary(text):
+    """Whole-word BUSINESS_TERMS in ASCII text, leftmost-longest and non-overlapping, in one automaton pass.
+
+    Same matches as the vocabulary pattern in BUSINESS_PATTERNS under re, RE2 or Hyperscan.
+    """
+    lowered = text.lower()
+    spans = []
+    for end, length in business_term_automaton.iter(lowered):
+        start, end = end - length + 1, end + 1
+        # Same word boundaries as \b around the alternation
+        if (start == 0 or not is_word_char(lowered[start - 1])) and (end == len(lowered) or not is_word_char(lowered[end])):
+            spans.append((start, end))
+    
+    matches = []
+    last_end = 0
+    for start, end in sorted(spans, key=lambda span: (span[0], -span[1])):
+        if start >= last_end:
+            matches.append(text[start:end])
+            last_end = end
+    return matches
+
+STOP_WORDS = frozenset({
+    'the', 'a', 'an', 'and', 'or', 'but', 'in', 'on', 'at', 'to', 'for', 'of', 'with', 'by',
+    'is', 'are', 'was', 'were', 'be', 'been', 'have', 'has', 'had', 'do', 'does', 'did',
+    'will', 'would', 'could', 'should', 'this', 'that', 'these', 'those', 'they', 'them',
+    'their', 'there', 'then', 'than', 'from', 'into', 'over', 'under', 'about', 'through'
+})
+
+def extract_keywords_basic(text, max_keywords):
+    """Enhanced basic keyword extraction"""
+    # Extract potential business terms
+    # Long documents repeat the same terms many times; filter each distinct match only once
+    candidates = {match.lower().strip() for match in find_business_terms(text)}
+    keywords = {
+        clean_match for clean_match in candidates
+        if (len(clean_match) >= 3 and len(clean_match) <= 25 and 
+            clean_match not in STOP_WORDS and clean_match.replace(' ', '').isalpha())
+    }
+    
+    # Word frequency as backup (alphabetic words longer than 3 letters)
+    word_freq = Counter(word for word in FREQUENT_WORD_RE.findall(text.lower()) if word not in STOP_WORDS)
     
     # Add top frequent words
-    frequent_words = sorted(word_freq.keys(), key=lambda x: word_freq[x], reverse=True)[:5]
-    keywords.update(frequent_words)
+    keywords.update(word for word, _ in word_freq.most_common(5))
     
     return list(keywords)[:max_keywords]
 
-def extract_business_metrics(text):
-    """Extract business metrics using advanced prompt engineering"""
-    try:
-        # Use sophisticated prompt engineering with few-shot learning
-        prompt = f"""You are an expert business analyst specializing in extracting key performance indicators from business documents.
+def build_metrics_prompt(text):
+    """Build the few-shot business metrics extraction prompt"""
+    # Use sophisticated prompt engineering with few-shot learning
+    return document_block(text), f"""You are an expert business analyst specializing in extracting key performance indicators from business documents.
 
-TASK: Extract the most important business metrics and KPIs from the following document.
+TASK: Extract the most important business metrics and KPIs from the document above.
 
 INSTRUCTIONS:
 1. Look for quantitative business metrics (revenue, growth rates, customer numbers, etc.)
@@ -321,26 +1344,18 @@ EXAMPLES OF GOOD METRICS:
 - Employee Count: 450 people
 - Market Share: 12% in North America
 
-DOCUMENT TO ANALYZE:
-{text[:1500]}
-
 EXTRACTED BUSINESS METRICS:
 1."""
-        
-        response = generate_with_llama(prompt, 200, 0.3)
-        
-        # Enhanced parsing with context awareness
-        ai_metrics = parse_ai_metrics_response(response)
-        
-        # Validate and clean metrics
-        validated_metrics = validate_extracted_metrics(ai_metrics, text)
-        
-        return validated_metrics[:8]
-        
-    except Exception as e:
-        logger.error(f"Metrics extraction error: {e}")
-        # Fallback to basic extraction
-        return extract_basic_metrics_fallback(text)
+
+def finalize_metrics(response, text):
+    """Parse the metrics response and keep only metrics grounded in the document"""
+    # Enhanced parsing with context awareness
+    ai_metrics = parse_ai_metrics_response(response)
+    
+    # Validate and clean metrics
+    validated_metrics = validate_extracted_metrics(ai_metrics, text)
+    
+    return validated_metrics[:8]
 
 def parse_ai_metrics_response(response):
     """Parse AI-generated metrics response with intelligent parsing"""
@@ -360,7 +1375,7 @@ def parse_ai_metrics_response(response):
             continue
         
         # Remove numbering, bullets, and prefixes
-        clean_line = re.sub(r'^[\d\.\-\*\•]+\s*', '', line)
+        clean_line = METRIC_PREFIX_RE.sub('', line)
         clean_line = clean_line.strip()
         
         # Look for metric pattern (Name: Value)
@@ -381,10 +1396,24 @@ def parse_ai_metrics_response(response):
     
     return metrics
 
+def find_substrings(needles, haystack):
+    """Return the needles that occur in haystack, scanning it once with Aho-Corasick when available"""
+    needles = set(needles)
+    if not needles:
+        return set()
+    
+    if ahocorasick is None:
+        return {needle for needle in needles if needle in haystack}
+    
+    automaton = ahocorasick.Automaton()
+    for needle in needles:
+        automaton.add_word(needle, needle)
+    automaton.make_automaton()
+    return {needle for _, needle in automaton.iter(haystack)}
+
 def validate_extracted_metrics(metrics, original_text):
     """Validate that extracted metrics actually exist in the source text"""
-    validated = []
-    text_lower = original_text.lower()
+    candidates = []
     
     for metric in metrics:
         if ':' in metric:
@@ -393,7 +1422,7 @@ def validate_extracted_metrics(metrics, original_text):
             value = value.strip()
             
             # Extract key numbers from the metric value
-            numbers_in_metric = re.findall(r'[\d,]+(?:\.\d+)?', value)
+            numbers_in_metric = METRIC_NUMBER_RE.findall(value)
             
             # Check if the metric name or similar appears in text
             name_words = name.split()
@@ -403,25 +1432,29 @@ def validate_extracted_metrics(metrics, original_text):
                 name_words[0] if name_words else '',
                 name.replace('rate', '').replace('count', '').strip()
             ]
-            
-            # Verify the metric has basis in the original text
-            name_found = any(variation in text_lower for variation in name_variations if len(variation) > 2)
-            number_found = any(num in original_text for num in numbers_in_metric)
-            
-            if name_found or number_found:
-                validated.append(metric)
+            name_variations = [variation for variation in name_variations if len(variation) > 2]
+            candidates.append((metric, name_variations, numbers_in_metric))
+    
+    # Search every name and number in one pass; lowercasing leaves digits and commas untouched,
+    # so numbers are found in the lowercased text exactly where they are in the original
+    found = find_substrings(
+        (needle for _, name_variations, numbers in candidates for needle in name_variations + numbers),
+        original_text.lower()
+    )
     
-    return validated
+    # Verify the metric has basis in the original text
+    return [
+        metric for metric, name_variations, numbers in candidates
+        if any(variation in found for variation in name_variations) or any(num in found for num in numbers)
+    ]
 
 def extract_basic_metrics_fallback(text):
     """Fallback extraction using business context understanding"""
     # Use AI for fallback with simpler prompt
-    prompt = f"""Extract up to 5 key business numbers from this text. 
+    prompt = document_block(text), f"""Extract up to 5 key business numbers from the document above. 
     Format as "Description: Number"
     Only include if you find actual numbers in the text.
     
-    Text: {text[:800]}
-    
     Key numbers:"""
     
     try:
@@ -430,15 +1463,14 @@ def extract_basic_metrics_fallback(text):
     except:
         return ["Document contains business data - detailed metrics extraction unavailable"]
 
-def generate_insights(keywords, metrics, summary):
-    """Generate business insights using advanced prompt engineering"""
-    try:
-        # Prepare context with proper formatting
-        keywords_context = ', '.join(keywords[:5]) if keywords else 'business operations'
-        metrics_context = '\n'.join([f"- {m}" for m in metrics[:4]]) if metrics else 'No specific metrics extracted'
-        
-        # Advanced prompt with role definition and structured thinking
-        prompt = f"""You are a senior business consultant analyzing a company document. Your task is to provide strategic insights based on the extracted data.
+def build_insights_prompt(keywords, metrics, summary):
+    """Build the strategic insights prompt from the other analysis results"""
+    # Prepare context with proper formatting
+    keywords_context = ', '.join(keywords[:5]) if keywords else 'business operations'
+    metrics_context = '\n'.join([f"- {m}" for m in metrics[:4]]) if metrics else 'No specific metrics extracted'
+    
+    # Advanced prompt with role definition and structured thinking
+    return f"""You are a senior business consultant analyzing a company document. Your task is to provide strategic insights based on the extracted data.
 
 ANALYSIS DATA:
 Key Focus Areas: {keywords_context}
@@ -458,21 +1490,17 @@ EXAMPLE INSIGHT FORMAT:
 
 STRATEGIC INSIGHTS:
 1."""
-        
-        insights = generate_with_llama(prompt, 180, 0.7)
-        
-        # Enhanced cleaning and structuring
-        insights = clean_and_structure_insights(insights)
-        
-        if not insights or len(insights) < 30:
-            # Intelligent fallback based on available data
-            insights = generate_fallback_insights(keywords, metrics, summary)
-        
-        return insights + " [AI-powered analysis with local processing]"
-        
-    except Exception as e:
-        logger.error(f"Insights generation error: {e}")
-        return generate_emergency_insights(keywords, metrics)
+
+def finalize_insights(response, keywords, metrics, summary):
+    """Structure the insights response, falling back to data-driven insights"""
+    # Enhanced cleaning and structuring
+    insights = clean_and_structure_insights(response)
+    
+    if not insights or len(insights) < 30:
+        # Intelligent fallback based on available data
+        insights = generate_fallback_insights(keywords, metrics, summary)
+    
+    return insights + " [AI-powered analysis with local processing]"
 
 def clean_and_structure_insights(insights_text):
     """Clean and structure AI-generated insights"""
@@ -487,9 +1515,9 @@ def clean_and_structure_insights(insights_text):
         line = line.strip()
         if len(line) > 20:  # Meaningful content
             # Remove numbering
-            clean_line = re.sub(r'^\d+\.\s*', '', line)
+            clean_line = NUMBERING_RE.sub('', line)
             # Remove bullet points
-            clean_line = re.sub(r'^[-•*]\s*', '', clean_line)
+            clean_line = BULLET_RE.sub('', clean_line)
             
             if clean_line and not clean_line.lower().startswith('insight'):
                 clean_insights.append(clean_line)
@@ -529,11 +1557,10 @@ def generate_emergency_insights(keywords, metrics):
     
     return f"Document analysis completed: {kw_count} key topics and {metric_count} metrics identified. Secure local processing maintained throughout analysis."
 
-def generate_plot_data(keywords, metrics):
-    """Generate plot/chart data suggestions using enhanced prompting"""
-    try:
-        # Enhanced prompt for visualization suggestions
-        prompt = f"""You are a data visualization expert. Create 2 meaningful charts based on the business analysis results.
+def build_plot_prompt(keywords, metrics):
+    """Build the chart suggestion prompt"""
+    # Enhanced prompt for visualization suggestions
+    return f"""You are a data visualization expert. Create 2 meaningful charts based on the business analysis results.
 
 AVAILABLE DATA:
 Key Topics: {', '.join(keywords[:5]) if keywords else 'General business data'}
@@ -553,13 +1580,24 @@ Revenue by Quarter|bar|Q1,Q2,Q3,Q4|120,135,150,180
 Market Share|pie|Product A,Product B,Product C|45,35,20
 
 VISUALIZATION SUGGESTIONS:"""
+
+def build_chart(title, chart_type, labels, values):
+    """Validate chart data and return a plot dict, or None if it is unusable"""
+    if (len(labels) == len(values) and 
+        len(labels) >= 2 and len(labels) <= 6 and
+        len(title) > 0 and len(title) < 50):
         
-        response = generate_with_llama(prompt, 120, 0.4)
-        return parse_enhanced_plot_data(response)
+        # Ensure chart type is valid
+        valid_types = ['bar', 'line', 'pie']
+        chart_type = chart_type if chart_type in valid_types else 'bar'
         
-    except Exception as e:
-        logger.error(f"Plot data generation error: {e}")
-        return generate_basic_plots(keywords, metrics)
+        return {
+            'title': title,
+            'type': chart_type,
+            'labels': labels,
+            'values': [int(v) for v in values]  # Convert to integers
+        }
+    return None
 
 def parse_enhanced_plot_data(response):
     """Parse AI-generated plot data with enhanced validation"""
@@ -589,7 +1627,7 @@ def parse_enhanced_plot_data(response):
                     for v in values_text.split(','):
                         v = v.strip()
                         # Extract numbers more carefully
-                        numbers = re.findall(r'\d+(?:\.\d+)?', v)
+                        numbers = NUMBER_RE.findall(v)
                         if numbers:
                             try:
                                 values.append(float(numbers[0]))
@@ -598,21 +1636,9 @@ def parse_enhanced_plot_data(response):
                         else:
                             values.append(10)
                     
-                    # Validate chart data
-                    if (len(labels) == len(values) and 
-                        len(labels) >= 2 and len(labels) <= 6 and
-                        len(title) > 0 and len(title) < 50):
-                        
-                        # Ensure chart type is valid
-                        valid_types = ['bar', 'line', 'pie']
-                        chart_type = chart_type if chart_type in valid_types else 'bar'
-                        
-                        plots.append({
-                            'title': title,
-                            'type': chart_type,
-                            'labels': labels,
-                            'values': [int(v) for v in values]  # Convert to integers
-                        })
+                    chart = build_chart(title, chart_type, labels, values)
+                    if chart:
+                        plots.append(chart)
                         
             except Exception as e:
                 logger.warning(f"Plot parsing error: {e}")
@@ -650,8 +1676,410 @@ def generate_basic_plots(keywords, metrics):
     
     return plots[:2]
 
+def build_structured_analysis_prompt(text, max_summary_length, max_keywords):
+    """Build the single prompt asking for the whole analysis as one JSON object"""
+    return document_block(text), f"""Analyze the document above and answer with one JSON object containing:
+- "summary": a summary of at most {max_summary_length} words focused on key facts and numbers
+- "keywords": up to {max_keywords} business keywords of 1-3 words each
+- "metrics": up to 8 metrics stated in the document, each formatted "Metric Name: Value"
+- "insights": 2-3 specific, actionable strategic insights connecting the metrics to business performance
+- "plots": 2 charts that best represent the data, each with "title", "type" (bar, line or pie), "labels" and numeric "values"
+
+JSON:"""
+
+def build_doc_analysis_schema(max_keywords):
+    """DOC_ANALYSIS_SCHEMA allowing up to max_keywords keywords"""
+    schema = copy.deepcopy(DOC_ANALYSIS_SCHEMA)
+    schema['properties']['keywords']['maxItems'] = max_keywords
+    return schema
+
+def analyze_document_structured(text, max_summary_length, max_keywords):
+    """Run the whole analysis as one guided-JSON generation.
+
+    Returns None when the backend has no guided decoding (transformers, older
+    vLLM) or generation fails, so the caller can use the batched prompts instead.
+    """
+    if llm_engine is None:
+        return None
+    
+    try:
+        from vllm import SamplingParams
+        from vllm.sampling_params import GuidedDecodingParams
+    except ImportError:
+        return None
+    
+    try:
+        params = SamplingParams(
+            max_tokens=(
+                STRUCTURED_BASE_TOKENS +
+                STRUCTURED_TOKENS_PER_SUMMARY_WORD * max_summary_length +
+                STRUCTURED_TOKENS_PER_KEYWORD * max_keywords
+            ),
+            temperature=0.3,
+            repetition_penalty=1.2,
+            guided_decoding=GuidedDecodingParams(json=build_doc_analysis_schema(max_keywords))
+        )
+        prompt = {'prompt_token_ids': encode_llama_prompt(build_structured_analysis_prompt(text, max_summary_length, max_keywords))}
+        data = json.loads(llm_engine.generate([prompt], [params])[0])
+        
+        keywords = parse_keywords_response(', '.join(data['keywords']), text, max_keywords)
+        metrics = validate_extracted_metrics(data['metrics'], text)[:8]
+        summary = clean_generated_text(data['summary']) or "No summary available"
+        plots = [build_chart(p['title'], p['type'], p['labels'], p['values']) for p in data['plots']]
+        
+        return {
+            'summary': summary,
+            'keywords': keywords,
+            'metrics': metrics,
+            'insights': finalize_insights(data['insights'], keywords, metrics, summary),
+            'plotData': [p for p in plots if p] or generate_basic_plots(keywords, metrics)
+        }
+    except Exception as e:
+        logger.warning(f"Structured analysis failed, falling back to batched prompts: {e}")
+        return None
+
+# Pseudo-field yielded last by iter_document_analysis when any stage fell back, so the analysis isn't cached
+DEGRADED_STAGE = 'degraded'
+
+def iter_document_analysis(text, max_summary_length, max_keywords):
+    """Run the analysis as two rounds of batched Llama prompts, yielding (field, value) as each result is ready"""
+    # Round 1: keywords, metrics (and the Llama summary when BART can't be used)
+    # are independent, so their prompts go to the backend as one batch
+    llama_summary = summary_uses_llama(text)
+    round_one = [
+        (build_keywords_prompt(text, max_keywords), 100, 0.2),
+        (build_metrics_prompt(text), 200, 0.3)
+    ]
+    if llama_summary:
+        round_one.append((build_summary_prompt(text, max_summary_length), max_summary_length // 2, 0.3))
+    
+    # The BART summary doesn't depend on round 1 either; it runs on the summary batcher's
+    # thread (coalesced with other requests' summaries) while the Llama batch generates
+    bart_summary = None if llama_summary else submit_summary(text, max_summary_length)
+    round_one_responses = generate_batch_with_llama(round_one)
+    degraded = any(response in FALLBACK_RESPONSES for response in round_one_responses)
+    
+    # Process the document with error handling for each step
+    try:
+        if llama_summary:
+            summary = round_one_responses[2]
+        else:
+            summary, summary_fallback = bart_summary.result(timeout=AI_BATCH_TIMEOUT)
+            degraded = degraded or summary_fallback
+    except Exception as e:
+        logger.warning(f"Summary error: {e}")
+        summary = "Summary unavailable due to processing error."
+        degraded = True
+    
+    try:
+        keywords = parse_keywords_response(round_one_responses[0], text, max_keywords)
+    except Exception as e:
+        logger.warning(f"Keywords error: {e}")
+        keywords = []
+        degraded = True
+    
+    try:
+        metrics = finalize_metrics(round_one_responses[1], text)
+    except Exception as e:
+        logger.warning(f"Metrics error: {e}")
+        metrics = extract_basic_metrics_fallback(text)
+        degraded = True
+    
+    yield 'summary', summary
+    yield 'keywords', keywords
+    yield 'metrics', metrics
+    
+    # Round 2: insights and chart suggestions depend on round 1 results
+    round_two_responses = generate_batch_with_llama([
+        (build_insights_prompt(keywords, metrics, summary), 180, 0.7),
+        (build_plot_prompt(keywords, metrics), 120, 0.4)
+    ])
+    degraded = degraded or any(response in FALLBACK_RESPONSES for response in round_two_responses)
+    
+    try:
+        insights = finalize_insights(round_two_responses[0], keywords, metrics, summary)
+    except Exception as e:
+        logger.warning(f"Insights error: {e}")
+        insights = generate_emergency_insights(keywords, metrics)
+        degraded = True
+    
+    try:
+        plot_data = parse_enhanced_plot_data(round_two_responses[1])
+    except Exception as e:
+        logger.warning(f"Plot data error: {e}")
+        plot_data = generate_basic_plots(keywords, metrics)
+        degraded = True
+    
+    yield 'insights', insights
+    yield 'plotData', plot_data
+    if degraded:
+        yield DEGRADED_STAGE, True
+
+def analyze_document_batched(text, max_summary_length, max_keywords):
+    """Run the analysis as two rounds of batched Llama prompts"""
+    analysis = dict(iter_document_analysis(text, max_summary_length, max_keywords))
+    analysis.pop(DEGRADED_STAGE, None)
+    return analysis
+
+def document_cache_key(text, *params):
+    """Hash the document (BLAKE3 when installed, else BLAKE2b) together with the analysis parameters"""
+    if blake3 is not None:
+        digest = blake3(text.encode()).hexdigest()
+    else:
+        digest = hashlib.blake2b(text.encode()).hexdigest()
+    return (digest,) + params
+
+def connect_result_cache_redis():
+    """Redis client for the shared result cache (None when not configured or unreachable)"""
+    if not RESULT_CACHE_REDIS_URL:
+        return None
+    try:
+        import redis
+        client = redis.Redis.from_url(RESULT_CACHE_REDIS_URL)
+        client.ping()
+        logger.info("✅ Sharing cached results through Redis")
+        return client
+    except Exception as e:
+        logger.warning(f"⚠️ Redis result cache unavailable, caching in process only: {e}")
+        return None
+
+def redis_cache_key(key):
+    """Flatten a document_cache_key() tuple into a Redis key"""
+    return 'ai-service:' + ':'.join(map(str, key))
+
+def get_cached_result(key):
+    """Return the cached result for key, marking it most recently used"""
+    with result_cache_lock:
+        result = result_cache.get(key)
+        if result is not None:
+            result_cache.move_to_end(key)
+            return result
+    
+    if result_cache_redis is not None:
+        try:
+            payload = result_cache_redis.get(redis_cache_key(key))
+        except Exception as e:
+            logger.warning(f"⚠️ Redis cache read failed: {e}")
+            payload = None
+        if payload is not None:
+            result = orjson.loads(payload) if orjson is not None else json.loads(payload)
+            store_cached_result(key, result, shared=False)
+            return result
+    return None
+
+def store_cached_result(key, result, shared=True):
+    """Cache a result, evicting the least recently used entries beyond RESULT_CACHE_SIZE"""
+    if RESULT_CACHE_SIZE > 0:
+        with result_cache_lock:
+            result_cache[key] = result
+            result_cache.move_to_end(key)
+            while len(result_cache) > RESULT_CACHE_SIZE:
+                result_cache.popitem(last=False)
+    
+    if shared and result_cache_redis is not None:
+        try:
+            payload = orjson.dumps(result) if orjson is not None else json.dumps(result)
+            result_cache_redis.setex(redis_cache_key(key), RESULT_CACHE_TTL, payload)
+        except Exception as e:
+            logger.warning(f"⚠️ Redis cache write failed: {e}")
+
+result_cache_redis = connect_result_cache_redis()
+
+def iter_document_stages(text, max_summary_length, max_keywords):
+    """Yield (field, value) analysis results: cached, guided JSON when supported, otherwise batched prompts"""
+    key = document_cache_key(text, max_summary_length, max_keywords)
+    cached = get_cached_result(key)
+    if cached is not None:
+        logger.info("♻️ Returning cached analysis for previously processed document")
+        yield from cached.items()
+        return
+    
+    analysis = analyze_document_structured(text, max_summary_length, max_keywords)
+    stages = analysis.items() if analysis is not None else iter_document_analysis(text, max_summary_length, max_keywords)
+    
+    completed = {}
+    degraded = False
+    for field, value in stages:
+        if field == DEGRADED_STAGE:
+            degraded = True
+            continue
+        completed[field] = value
+        yield field, value
+    
+    # A fallback from a transient backend failure would otherwise be served until evicted
+    if not degraded:
+        store_cached_result(key, completed)
+
+def build_document_result(analysis, processing_time):
+    """Assemble the /process-sensitive-document response from the analysis fields"""
+    # Determine which model was actually used
+    model_used = "Llama-3.1-8B-Instruct" if (llm_engine or qwen_pipeline) else "DistilGPT2"
+    if not llm_engine and not qwen_pipeline and not summarization_pipeline:
+        model_used = "Limited AI processing"
+    
+    return {
+        'summary': analysis.get('summary') or "No summary available",
+        'keywords': analysis.get('keywords') or [],
+        'metrics': analysis.get('metrics') or [],
+        'insights': analysis.get('insights') or "Analysis completed with limited AI capabilities",
+        'plotData': analysis.get('plotData') or [],
+        'model': model_used,
+        'processing_time': round(processing_time, 2),
+        'timestamp': datetime.now().isoformat()
+    }
+
+def json_response(data):
+    """Serialize a JSON response with orjson when installed, otherwise jsonify"""
+    if orjson is None:
+        return jsonify(data)
+    return app.response_class(orjson.dumps(data), mimetype='application/json')
+
+def sse_event(event, data):
+    """Format one Server-Sent Events message"""
+    payload = orjson.dumps(data).decode() if orjson is not None else json.dumps(data)
+    return f"event: {event}\ndata: {payload}\n\n"
+
+def stream_document_analysis(text, max_summary_length, max_keywords):
+    """Stream each analysis field as an SSE event as soon as it is ready, then the full result"""
+    start_time = time.time()
+    yield sse_event('start', {'timestamp': datetime.now().isoformat()})
+    
+    try:
+        analysis = {}
+        for field, value in iter_document_stages(text, max_summary_length, max_keywords):
+            analysis[field] = value
+            yield sse_event(field, value)
+        
+        processing_time = time.time() - start_time
+        logger.info(f"✅ Document streamed in {processing_time:.2f}s")
+        yield sse_event('result', build_document_result(analysis, processing_time))
+        
+    except Exception as e:
+        logger.error(f"❌ Error streaming document analysis: {e}")
+        yield sse_event('error', {
+            'error': str(e),
+            'fallback_processed': True,
+            'timestamp': datetime.now().isoformat()
+        })
+
+def stream_summary(text, max_length):
+    """Stream /summarize as SSE: token events while BART decodes, then the cleaned summary"""
+    yield sse_event('start', {'timestamp': datetime.now().isoformat()})
+    
+    try:
+        # Streamed summaries decode greedily, so they're cached apart from /summarize's beam search ones
+        key = document_cache_key(text, 'summary-stream', max_length)
+        summary = get_cached_result(key)
+        cached = summary is not None
+        if not cached:
+            for event, value in iter_summary_stream(text, max_length):
+                if event == 'token':
+                    yield sse_event('token', {'token': value})
+                else:
+                    summary = value
+                    fallback = event == 'fallback'
+            # Extractive and placeholder summaries are answered but not cached
+            if not fallback:
+                store_cached_result(key, summary)
+        
+        yield sse_event('result', {
+            'summary': summary,
+            'cached': cached,
+            'timestamp': datetime.now().isoformat()
+        })
+        
+    except Exception as e:
+        logger.error(f"❌ Error streaming summary: {e}")
+        yield sse_event('error', {'error': str(e), 'timestamp': datetime.now().isoformat()})
+
+# Request coalescing for the single-task endpoints
+summary_batcher = BatchedInferenceEngine("summary-batcher", summarize_texts, AI_BATCH_MAX, AI_BATCH_WAIT_MS)
+keyword_batcher = BatchedInferenceEngine("keyword-batcher", extract_keywords_batch, AI_BATCH_MAX, AI_BATCH_WAIT_MS)
+
+def submit_summary(text, max_length):
+    """Queue a summary on summary_batcher and return a Future resolving to its (summary, fallback) pair.
+
+    Texts that may not fit one BART window are condensed first on their own thread, so the
+    map passes over a long document don't hold up every other summary queued on the batcher.
+    """
+    # Under one character per token a text always fits BART's window
+    if summary_uses_llama(text) or len(text) <= 1024:
+        return summary_batcher.submit(text, max_length)
+    
+    future = Future()
+    
+    def deliver(result):
+        try:
+            if result.exception() is not None:
+                future.set_exception(result.exception())
+            else:
+                future.set_result(result.result())
+        except Exception as e:
+            logger.error(f"Batch result delivery error: {e}")
+    
+    def condense_and_submit():
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            condensed = condense_to_summary_window([WHITESPACE_RE.sub(' ', text.strip())])[0]
+        except Exception as e:
+            logger.error(f"Summarization error: {e}")
+            slot = item_fallback(extractive_summary, text, max_length)
+            if isinstance(slot, Exception):
+                future.set_exception(slot)
+            else:
+                future.set_result(slot)
+            return
+        summary_batcher.submit(condensed, max_length).add_done_callback(deliver)
+    
+    threading.Thread(target=condense_and_submit, name="summary-condense", daemon=True).start()
+    return future
+
+# Blocking model work awaited by the async views; generation_slots still bounds concurrent generate() calls
+inference_pool = ThreadPoolExecutor(max_workers=GENERATION_CONCURRENCY, thread_name_prefix="inference")
+
+async def await_batched(future):
+    """Await a batcher Future from an async view, giving up after AI_BATCH_TIMEOUT"""
+    return await asyncio.wait_for(asyncio.wrap_future(future), AI_BATCH_TIMEOUT)
+
+async def run_inference(fn, *args):
+    """Run a blocking model call on the inference pool without blocking the event loop"""
+    return await asyncio.get_running_loop().run_in_executor(inference_pool, fn, *args)
+
+# Endpoints that need the models; /health reports loading status instead of failing
+MODEL_ENDPOINTS = frozenset({'process_sensitive_document', 'extract_keywords_endpoint', 'summarize_endpoint'})
+
+def read_int_param(data, field, default, maximum):
+    """Read an optional integer request field (numeric strings are accepted), raising ValueError when it is out of range"""
+    value = data.get(field, default)
+    if isinstance(value, str) and value.strip().isdigit():
+        value = int(value)
+    if isinstance(value, bool) or not isinstance(value, int) or not 1 <= value <= maximum:
+        raise ValueError(f"'{field}' must be an integer between 1 and {maximum}")
+    return value
+
 # Flask Routes
 
+@app.errorhandler(413)
+def request_too_large(e):
+    """JSON body for bodies refused by MAX_CONTENT_LENGTH"""
+    return json_response({'error': f'Text too large (limit {MAX_TEXT_CHARS} characters)'}), 413
+
+@app.before_request
+def reject_oversized_text():
+    """Refuse documents beyond MAX_TEXT_CHARS before any model work is queued"""
+    if request.endpoint in MODEL_ENDPOINTS:
+        data = request.get_json(silent=True)
+        text = data.get('text') if isinstance(data, dict) else None
+        if isinstance(text, str) and len(text) > MAX_TEXT_CHARS:
+            return json_response({'error': f'Text too large (limit {MAX_TEXT_CHARS} characters)'}), 413
+
+@app.before_request
+def require_models():
+    """Load the models before the first model-backed request; afterwards this is a flag check"""
+    if not models_loaded and request.endpoint in MODEL_ENDPOINTS and not load_models():
+        return json_response({'error': 'Failed to load AI models'}), 500
+
 @app.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint with model loading"""
@@ -671,12 +2099,13 @@ def health_check():
         if load_success:
             logger.info("✅ Models loaded successfully during health check")
     
-    return jsonify({
+    return json_response({
         'status': 'healthy',
         'models_loaded': models_loaded,
         'device_info': device_info,
         'model_details': {
-            'llama_available': qwen_pipeline is not None,
+            'llama_available': llm_engine is not None or qwen_pipeline is not None,
+            'llm_backend': 'vllm' if llm_engine is not None else 'transformers',
             'summarization_available': summarization_pipeline is not None,
             'sentiment_available': sentiment_pipeline is not None
         },
@@ -684,138 +2113,137 @@ def health_check():
     })
 
 @app.route('/process-sensitive-document', methods=['POST'])
-def process_sensitive_document():
+async def process_sensitive_document():
     """Main endpoint for processing sensitive documents"""
     try:
-        # Load models if not already loaded
-        if not load_models():
-            return jsonify({'error': 'Failed to load AI models'}), 500
+        data = request.get_json(silent=True)
         
-        data = request.get_json()
-        
-        if not data or 'text' not in data:
-            return jsonify({'error': 'No text provided'}), 400
+        if not isinstance(data, dict) or not isinstance(data.get('text'), str):
+            return json_response({'error': 'No text provided'}), 400
         
         text = data['text'].strip()
         if len(text) < 20:
-            return jsonify({'error': 'Document text too short for meaningful analysis'}), 400
-        
-        max_summary_length = data.get('max_summary_length', 300)
-        max_keywords = data.get('max_keywords', 10)
-        
-        logger.info(f"🔒 Processing sensitive document ({len(text)} characters)")
-        start_time = time.time()
-        
-        # Process the document with error handling for each step
-        try:
-            summary = summarize_text(text, max_summary_length)
-        except Exception as e:
-            logger.warning(f"Summary error: {e}")
-            summary = "Summary unavailable due to processing error."
+            return json_response({'error': 'Document text too short for meaningful analysis'}), 400
         
         try:
-            keywords = extract_keywords(text, max_keywords)
-        except Exception as e:
-            logger.warning(f"Keywords error: {e}")
-            keywords = []
+            max_summary_length = read_int_param(data, 'max_summary_length', 300, MAX_SUMMARY_LENGTH)
+            max_keywords = read_int_param(data, 'max_keywords', 10, MAX_KEYWORDS)
+        except ValueError as e:
+            return json_response({'error': str(e)}), 400
         
-        try:
-            metrics = extract_business_metrics(text)
-        except Exception as e:
-            logger.warning(f"Metrics error: {e}")
-            metrics = []
-        
-        try:
-            insights = generate_insights(keywords, metrics, summary)
-        except Exception as e:
-            logger.warning(f"Insights error: {e}")
-            insights = "Insights generation temporarily unavailable."
+        logger.info(f"🔒 Processing sensitive document ({len(text)} characters)")
         
-        try:
-            plot_data = generate_plot_data(keywords, metrics)
-        except Exception as e:
-            logger.warning(f"Plot data error: {e}")
-            plot_data = []
+        # Opt-in Server-Sent Events: each field is sent as soon as its stage finishes
+        if data.get('stream') or request.accept_mimetypes.best == 'text/event-stream':
+            return Response(
+                stream_document_analysis(text, max_summary_length, max_keywords),
+                mimetype='text/event-stream',
+                headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+            )
         
+        start_time = time.time()
+        analysis = await run_inference(lambda: dict(iter_document_stages(text, max_summary_length, max_keywords)))
         processing_time = time.time() - start_time
+        result = build_document_result(analysis, processing_time)
         
-        # Determine which model was actually used
-        model_used = "Llama-3.1-8B-Instruct" if qwen_pipeline else "DistilGPT2"
-        if not qwen_pipeline and not summarization_pipeline:
-            model_used = "Limited AI processing"
-        
-        result = {
-            'summary': summary or "No summary available",
-            'keywords': keywords or [],
-            'metrics': metrics or [],
-            'insights': insights or "Analysis completed with limited AI capabilities",
-            'plotData': plot_data or [],
-            'processedLocally': True,
-            'processedWithAI': models_loaded,
-            'model': model_used,
-            'processing_time': round(processing_time, 2),
-            'text_length': len(text),
-            'timestamp': datetime.now().isoformat()
-        }
-        
-        logger.info(f"✅ Document processed in {processing_time:.2f}s - Summary: {len(summary)} chars, Keywords: {len(keywords)}, Metrics: {len(metrics)}")
-        return jsonify(result)
+        logger.info(f"✅ Document processed in {processing_time:.2f}s - Summary: {len(result['summary'])} chars, Keywords: {len(result['keywords'])}, Metrics: {len(result['metrics'])}")
+        return json_response(result)
         
     except Exception as e:
         logger.error(f"❌ Error processing document: {e}")
-        return jsonify({
+        return json_response({
             'error': str(e),
             'fallback_processed': True,
             'timestamp': datetime.now().isoformat()
         }), 500
 
 @app.route('/extract-keywords', methods=['POST'])
-def extract_keywords_endpoint():
+async def extract_keywords_endpoint():
     """Extract keywords from text"""
     try:
-        if not load_models():
-            return jsonify({'error': 'Models not available'}), 500
-            
-        data = request.get_json()
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict) or not isinstance(data.get('text', ''), str):
+            return json_response({'error': 'No text provided'}), 400
+        
         text = data.get('text', '')
-        max_keywords = data.get('max_keywords', 10)
+        try:
+            max_keywords = read_int_param(data, 'max_keywords', 10, MAX_KEYWORDS)
+        except ValueError as e:
+            return json_response({'error': str(e)}), 400
         
-        keywords = extract_keywords(text, max_keywords)
+        key = document_cache_key(text, 'keywords', max_keywords)
+        keywords = get_cached_result(key)
+        cached = keywords is not None
+        if not cached:
+            keywords, fallback = await await_batched(keyword_batcher.submit(text, max_keywords))
+            # Pattern-based keywords from a failed generation are answered but not cached
+            if not fallback:
+                store_cached_result(key, keywords)
         
-        return jsonify({
+        return json_response({
             'keywords': keywords,
+            'cached': cached,
             'timestamp': datetime.now().isoformat()
         })
         
+    except asyncio.TimeoutError:
+        return json_response({'error': 'Timed out waiting for the model'}), 504
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return json_response({'error': str(e)}), 500
 
 @app.route('/summarize', methods=['POST'])
-def summarize_endpoint():
+async def summarize_endpoint():
     """Summarize text"""
     try:
-        if not load_models():
-            return jsonify({'error': 'Models not available'}), 500
-            
-        data = request.get_json()
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict) or not isinstance(data.get('text', ''), str):
+            return json_response({'error': 'No text provided'}), 400
+        
         text = data.get('text', '')
-        max_length = data.get('max_length', 150)
+        try:
+            max_length = read_int_param(data, 'max_length', 150, MAX_SUMMARY_LENGTH)
+        except ValueError as e:
+            return json_response({'error': str(e)}), 400
+        
+        # Opt-in Server-Sent Events: summary text is sent as BART decodes it
+        if data.get('stream') or request.accept_mimetypes.best == 'text/event-stream':
+            return Response(
+                stream_summary(text, max_length),
+                mimetype='text/event-stream',
+                headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+            )
         
-        summary = summarize_text(text, max_length)
+        key = document_cache_key(text, 'summary', max_length)
+        summary = get_cached_result(key)
+        cached = summary is not None
+        if not cached:
+            summary, fallback = await await_batched(submit_summary(text, max_length))
+            # Extractive and placeholder summaries are answered but not cached
+            if not fallback:
+                store_cached_result(key, summary)
         
-        return jsonify({
+        return json_response({
             'summary': summary,
+            'cached': cached,
             'timestamp': datetime.now().isoformat()
         })
         
+    except asyncio.TimeoutError:
+        return json_response({'error': 'Timed out waiting for the model'}), 504
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return json_response({'error': str(e)}), 500
+
+if WARMUP and __name__ != '__main__':
+    load_models()
 
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5001))
     debug = os.environ.get('DEBUG', 'false').lower() == 'true'
     
     logger.info(f"🚀 Starting AI Service on port {port}")
-    logger.info("📚 Models will be loaded on first request for faster startup")
+    
+    # Load and warm the models before serving (in the reloader's child process when debugging)
+    if not debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        load_models()
     
     app.run(host='0.0.0.0', port=port, debug=debug) 
\ No newline at end of file
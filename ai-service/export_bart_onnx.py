@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Offline ONNX export + dynamic INT8 quantization for the AI service's BART summarizer
+Writes a snapshot that app.py runs on CPU with ONNX Runtime via SUMMARIZATION_ONNX_PATH
+
+Usage: python export_bart_onnx.py [output_dir]
+"""
+
+import os
+import sys
+import glob
+import shutil
+import logging
+import tempfile
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+MODEL_ID = os.getenv('SUMMARIZATION_MODEL', "facebook/bart-large-cnn")
+DEFAULT_OUTPUT_DIR = "models/bart-large-cnn-onnx-int8"
+
+def export(output_dir):
+    """Export BART to ONNX, quantize its weights to INT8 and save model + tokenizer to output_dir.
+
+    The snapshot is built in a staging directory beside output_dir and moved into place only once
+    complete, so a failed export leaves nothing that app.py would mistake for a snapshot.
+    """
+    output_dir = os.path.abspath(output_dir)
+    parent_dir = os.path.dirname(output_dir)
+    os.makedirs(parent_dir, exist_ok=True)
+    staging_dir = tempfile.mkdtemp(prefix=f".{os.path.basename(output_dir)}-", dir=parent_dir)
+    try:
+        export_snapshot(staging_dir)
+        if os.path.isdir(output_dir):
+            shutil.rmtree(output_dir)
+        os.replace(staging_dir, output_dir)
+    except BaseException:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        raise
+
+    logger.info(f"✅ ONNX INT8 snapshot saved to {output_dir}")
+    logger.info(f"Set SUMMARIZATION_ONNX_PATH={output_dir} in .env")
+
+def export_snapshot(output_dir):
+    """Write the quantized encoder/decoder, configs and tokenizer to output_dir"""
+    from optimum.onnxruntime import ORTModelForSeq2SeqLM, ORTQuantizer
+    from optimum.onnxruntime.configuration import AutoQuantizationConfig
+    from transformers import AutoTokenizer
+
+    # Dynamic quantization targeting AVX-512 VNNI int8 dot products (falls back to AVX2 kernels at runtime)
+    quantization_config = AutoQuantizationConfig.avx512_vnni(is_static=False, per_channel=False)
+
+    with tempfile.TemporaryDirectory() as onnx_dir:
+        logger.info(f"📥 Exporting {MODEL_ID} to ONNX...")
+        model = ORTModelForSeq2SeqLM.from_pretrained(MODEL_ID, export=True)
+        model.save_pretrained(onnx_dir)
+
+        logger.info("🗜️ Quantizing encoder and decoder to INT8...")
+        for onnx_path in sorted(glob.glob(os.path.join(onnx_dir, "*.onnx"))):
+            quantizer = ORTQuantizer.from_pretrained(onnx_dir, file_name=os.path.basename(onnx_path))
+            # Keep the exported file names so ORTModelForSeq2SeqLM finds them without extra arguments
+            quantizer.quantize(save_dir=output_dir, quantization_config=quantization_config, file_suffix="")
+
+        model.config.save_pretrained(output_dir)
+        model.generation_config.save_pretrained(output_dir)
+
+    AutoTokenizer.from_pretrained(MODEL_ID).save_pretrained(output_dir)
+
+if __name__ == '__main__':
+    export(sys.argv[1] if len(sys.argv) > 1 else DEFAULT_OUTPUT_DIR)
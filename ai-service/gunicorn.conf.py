@@ -0,0 +1,68 @@
+"""
+Gunicorn settings for the AI service
+Usage: gunicorn -c gunicorn.conf.py app:app
+"""
+
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 5001)}"
+
+# Unless preloaded (below), every worker loads its own copy of the models. On a GPU keep one worker: its threads share
+# the vLLM engine / request batchers, which already batch and serialize GPU work. CPU-only deployments
+# with enough RAM for several model copies can raise WORKERS towards the core count.
+workers = int(os.environ.get('WORKERS', '1'))
+worker_class = 'gthread'
+threads = int(os.environ.get('THREADS', '32'))
+
+# CPU-only deployments can load the models once in the master (PRELOAD_MODELS=true): forked workers
+# then share the weight pages copy-on-write, since inference never writes them, so RAM no longer grows
+# with WORKERS. Leave it off on a GPU, where each worker must load after fork: a CUDA context doesn't
+# survive fork()
+preload_app = os.environ.get('PRELOAD_MODELS', 'false').lower() == 'true'
+
+# Model loading and warmup happen in post_worker_init, before the worker accepts requests
+timeout = int(os.environ.get('WORKER_TIMEOUT', '600'))
+graceful_timeout = 30
+
+# app.py gives each worker cores // workers torch/ONNX Runtime threads (TORCH_THREADS overrides).
+# PIN_WORKERS=true also binds each worker to its own slice of cores, so workers stop migrating
+# across each other's caches; combined with PRELOAD_MODELS the master sizes ONNX Runtime for one
+# slice and each worker resizes torch's pool after it is pinned
+pin_workers = os.environ.get('PIN_WORKERS', 'false').lower() == 'true'
+
+accesslog = '-'
+errorlog = '-'
+loglevel = os.environ.get('LOG_LEVEL', 'info')
+
+def pre_fork(server, worker):
+    """Give the new worker the lowest core slice not held by a live worker"""
+    taken = {getattr(w, 'cpu_slot', None) for w in server.WORKERS.values()}
+    worker.cpu_slot = min(slot for slot in range(len(server.WORKERS) + 1) if slot not in taken)
+
+def post_fork(server, worker):
+    """Pin the worker to its core slice when PIN_WORKERS is enabled, then size torch's threads to it"""
+    if not pin_workers or not hasattr(os, 'sched_setaffinity'):
+        return
+    cores = sorted(os.sched_getaffinity(0))
+    per_worker = max(1, len(cores) // server.num_workers)
+    start = (worker.cpu_slot % server.num_workers) * per_worker
+    os.sched_setaffinity(0, cores[start:start + per_worker] or cores)
+    
+    import app
+    app.cpu_pinned = True
+    if preload_app:
+        # The thread pools inherited from the master weren't sized for this slice
+        app.size_cpu_threads()
+
+def on_starting(server):
+    """With preload_app, load and warm the models in the master before any worker is forked"""
+    # app.py splits cores across WORKERS; keep it in step with -w / --workers
+    os.environ['WORKERS'] = str(server.num_workers)
+    if preload_app:
+        import app
+        app.load_models()
+
+def post_worker_init(worker):
+    """Load and warm the models in each worker before it starts serving (no-op after a preload)"""
+    import app
+    app.load_models()
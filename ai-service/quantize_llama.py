@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+"""
+Offline AWQ quantization for the AI service's Llama model
+Writes a 4-bit snapshot that app.py loads with LLAMA_QUANTIZATION=awq
+
+Usage: python quantize_llama.py [output_dir]
+"""
+
+import sys
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+MODEL_ID = "meta-llama/Llama-3.1-8B-Instruct"
+DEFAULT_OUTPUT_DIR = "models/Llama-3.1-8B-Instruct-AWQ"
+QUANT_CONFIG = {"zero_point": True, "q_group_size": 128, "w_bit": 4, "version": "GEMM"}
+
+def quantize(output_dir):
+    """Quantize Llama weights to AWQ int4 and save model + tokenizer to output_dir"""
+    from awq import AutoAWQForCausalLM
+    from transformers import AutoTokenizer
+    
+    logger.info(f"📥 Loading {MODEL_ID}...")
+    model = AutoAWQForCausalLM.from_pretrained(MODEL_ID, low_cpu_mem_usage=True)
+    tokenizer = AutoTokenizer.from_pretrained(MODEL_ID)
+    
+    logger.info("🗜️ Running AWQ calibration and quantization...")
+    model.quantize(tokenizer, quant_config=QUANT_CONFIG)
+    
+    model.save_quantized(output_dir)
+    tokenizer.save_pretrained(output_dir)
+    logger.info(f"✅ Quantized snapshot saved to {output_dir}")
+    logger.info(f"Set LLAMA_QUANTIZATION=awq and LLAMA_MODEL_PATH={output_dir} in .env")
+
+if __name__ == '__main__':
+    quantize(sys.argv[1] if len(sys.argv) > 1 else DEFAULT_OUTPUT_DIR)
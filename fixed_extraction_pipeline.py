@@ -104,6 +104,40 @@ class ImprovedFinancialExtractor:
                 r'(\d+\.?\d*)%.*growth',
             ]
         }
+        
+        # One Hyperscan pass finds which patterns occur at all; only those run through re for their groups
+        self.prefilter = self.build_prefilter()
+    
+    def build_prefilter(self):
+        """Compile every pattern into one Hyperscan database (None without hyperscan)"""
+        try:
+            import hyperscan
+        except ImportError:
+            return None
+        
+        expressions = [pattern for patterns in self.patterns.values() for pattern in patterns]
+        database = hyperscan.Database()
+        database.compile(
+            expressions=[pattern.encode() for pattern in expressions],
+            ids=list(range(len(expressions))),
+            elements=len(expressions),
+            flags=[hyperscan.HS_FLAG_SINGLEMATCH] * len(expressions)
+        )
+        return database, expressions
+    
+    def matching_patterns(self, text_clean: str) -> Optional[set]:
+        """Patterns that match somewhere in text_clean, or None to try every pattern"""
+        # Hyperscan's \s and \d are ASCII-only, unlike re's
+        if self.prefilter is None or not text_clean.isascii():
+            return None
+        
+        database, expressions = self.prefilter
+        found = set()
+        database.scan(
+            text_clean.encode(),
+            match_event_handler=lambda pattern_id, start, end, flags, context: found.add(expressions[pattern_id])
+        )
+        return found
     
     def extract_metrics(self, text: str) -> Dict[str, str]:
         """Extract metrics with MUCH better patterns"""
@@ -112,8 +146,11 @@ class ImprovedFinancialExtractor:
         
         print(f"🔍 Analyzing: {text[:100]}...")  # Debug
         
+        found = self.matching_patterns(text_clean)
         for metric_type, patterns in self.patterns.items():
             for pattern in patterns:
+                if found is not None and pattern not in found:
+                    continue
                 matches = re.findall(pattern, text_clean)
                 if matches:
                     print(f"  ✅ Found {metric_type}: {matches}")  # Debug
@@ -104,7 +104,11 @@ fi
 
 # Start Flask service
 echo "🚀 Starting Flask AI service..."
-python app.py > ../logs/ai-service.log 2>&1 &
+if command -v gunicorn &> /dev/null; then
+    gunicorn -c gunicorn.conf.py app:app > ../logs/ai-service.log 2>&1 &
+else
+    python app.py > ../logs/ai-service.log 2>&1 &
+fi
 AI_PID=$!
 echo $AI_PID > ../ai-service.pid
 